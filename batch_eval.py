@@ -0,0 +1,114 @@
+"""
+Evaluation of many positions at once with NumPy, for the tuner and the dataset tools.
+
+The positions are stacked into bitboards, one row of 12 per board (White then Black, pawn to king), which are
+unpacked into 0/1 planes of 64 squares. The batch score of a position is exactly the one of evaluate_board
+without the terms that need move generation (mobility), that is evaluate_material + evaluate_pawn_structure.
+The material signatures with a specialised endgame evaluation (uci_minimax.ENDGAMES) are scored by it, as in
+evaluate_board; they do not depend on the tuned parameters, so the tuner leaves them out.
+
+NumPy is a dependency of the tools only, installed with test_bot/test-requirements.txt; the engine and the bot
+run without it.
+"""
+from collections.abc import Sequence
+import chess
+import numpy as np
+import numpy.typing as npt
+
+import uci_minimax
+
+# Order of the planes: (color, piece_type) for White then Black, pawn to king
+PLANES = [(color, piece_type) for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES]
+WHITE_PAWNS = PLANES.index((chess.WHITE, chess.PAWN))
+BLACK_PAWNS = PLANES.index((chess.BLACK, chess.PAWN))
+# Piece counts by plane of the material signatures of uci_minimax.ENDGAME_EVALUATORS, such as 'KRvK'
+ENDGAME_COUNTS = np.array([[key.split("v")[0 if color == chess.WHITE else 1].count(chess.piece_symbol(piece_type).upper())
+                            for color, piece_type in PLANES] for key in uci_minimax.ENDGAME_EVALUATORS], dtype=np.int64)
+
+
+def board_bitboards(boards: Sequence[chess.Board]) -> npt.NDArray[np.uint64]:
+    """Stack the piece bitboards of the boards into an (N, 12) uint64 array."""
+    return np.array([[board.pieces_mask(piece_type, color) for color, piece_type in PLANES] for board in boards],
+                    dtype=np.uint64).reshape(-1, len(PLANES))
+
+
+def specialised_endgames(bitboards: npt.ArrayLike) -> npt.NDArray[np.bool_]:
+    """Mask of the positions whose material signature has a specialised endgame evaluation, from (N, 12) bitboards."""
+    counts = np.bitwise_count(np.asarray(bitboards, dtype=np.uint64)).astype(np.int64)
+    mask = np.zeros(len(counts), dtype=bool)
+    for signature in ENDGAME_COUNTS:
+        mask |= (counts == signature).all(axis=1)
+    return mask
+
+
+def bitboards_to_planes(bitboards: npt.ArrayLike) -> npt.NDArray[np.uint8]:
+    """Unpack (N, 12) bitboards into (N, 12, 64) 0/1 planes, square a1 first."""
+    as_bytes = np.ascontiguousarray(bitboards, dtype="<u8").view(np.uint8)
+    return np.unpackbits(as_bytes, axis=-1, bitorder="little").reshape(-1, len(PLANES), 64)
+
+
+def square_weights(material_values: dict[chess.PieceType, int],
+                   piece_square_tables: dict[chess.PieceType, list[list[int]]]) -> npt.NDArray[np.int64]:
+    """(12, 64) weights of the planes: the piece-square tables with material, negated for Black."""
+    tables = uci_minimax.build_piece_square_tables(material_values, piece_square_tables)
+    return np.array([tables[color][piece_type] if color == chess.WHITE else [-value for value in tables[color][piece_type]]
+                     for color, piece_type in PLANES], dtype=np.int64)
+
+
+MIDDLEGAME_WEIGHTS = square_weights(uci_minimax.MATERIAL_VALUES, uci_minimax.pst_2d)
+ENDGAME_WEIGHTS = square_weights(uci_minimax.MATERIAL_VALUES_EG, uci_minimax.pst_2d_eg)
+PHASE_WEIGHTS = np.array([uci_minimax.PHASE_WEIGHTS[piece_type] for _, piece_type in PLANES], dtype=np.int64)
+
+
+def game_phase(planes: npt.NDArray[np.uint8]) -> npt.NDArray[np.int64]:
+    """Game phase of each position, as uci_minimax.game_phase."""
+    piece_counts: npt.NDArray[np.int64] = planes.sum(axis=2, dtype=np.int64)
+    return piece_counts @ PHASE_WEIGHTS
+
+
+def evaluate_material(planes: npt.NDArray[np.uint8], middlegame_weights: npt.NDArray[np.int64] = MIDDLEGAME_WEIGHTS,
+                      endgame_weights: npt.NDArray[np.int64] = ENDGAME_WEIGHTS) -> npt.NDArray[np.int64]:
+    """Tapered material and piece-square score of each position, as uci_minimax.evaluate_material."""
+    phase: npt.NDArray[np.int64] = np.minimum(game_phase(planes), uci_minimax.MAX_PHASE)
+    flat = planes.reshape(len(planes), -1).astype(np.int64)
+    middlegame = flat @ middlegame_weights.reshape(-1)
+    endgame = flat @ endgame_weights.reshape(-1)
+    return (middlegame * phase + endgame * (uci_minimax.MAX_PHASE - phase)) // uci_minimax.MAX_PHASE
+
+
+def pawn_structure_counts(planes: npt.NDArray[np.uint8]) -> npt.NDArray[np.int64]:
+    """White minus Black doubled, isolated and blocked pawns of each position."""
+    occupied = planes.max(axis=1)
+    counts = np.zeros(len(planes), dtype=np.int64)
+    for color, index in ((chess.WHITE, WHITE_PAWNS), (chess.BLACK, BLACK_PAWNS)):
+        pawns = planes[:, index, :].astype(np.int64)
+        file_counts: npt.NDArray[np.int64] = pawns.reshape(-1, 8, 8).sum(axis=1)
+        doubled = np.maximum(file_counts - 1, 0).sum(axis=1)
+        neighbours = np.zeros_like(file_counts)
+        neighbours[:, 1:] += file_counts[:, :-1]
+        neighbours[:, :-1] += file_counts[:, 1:]
+        isolated = (file_counts * (neighbours == 0)).sum(axis=1)
+        # The square in front of the pawn is occupied
+        if color == chess.WHITE:
+            blocked = (pawns[:, :56] & occupied[:, 8:]).sum(axis=1)
+        else:
+            blocked = (pawns[:, 8:] & occupied[:, :56]).sum(axis=1)
+        counts = counts + (1 if color == chess.WHITE else -1) * (doubled + isolated + blocked)
+    return counts
+
+
+def evaluate_planes(planes: npt.NDArray[np.uint8]) -> npt.NDArray[np.int64]:
+    """White-relative score of each position without mobility."""
+    return evaluate_material(planes) + uci_minimax.PAWN_STRUCTURE_WEIGHT * pawn_structure_counts(planes)
+
+
+def evaluate_batch(boards: Sequence[chess.Board]) -> npt.NDArray[np.int64]:
+    """White-relative score of each board, evaluate_board less the mobility term, as an int64 array."""
+    bitboards = board_bitboards(boards)
+    scores = evaluate_planes(bitboards_to_planes(bitboards))
+    for index in np.flatnonzero(specialised_endgames(bitboards)):
+        # Like evaluate_board, the specialised evaluation wins when it knows the position
+        endgame = uci_minimax.evaluate_endgame(boards[int(index)])
+        if endgame is not None:
+            scores[index] = endgame
+    return scores
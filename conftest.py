@@ -0,0 +1,25 @@
+"""Fixtures shared by the tests of the engine tools."""
+import random
+from typing import Callable
+import chess
+import chess.pgn
+import pytest
+
+
+def write_random_games(path: str, count: int = 6) -> None:
+    """Write random games with their results to a PGN file."""
+    rng = random.Random(3)
+    with open(path, "w") as pgn:
+        for _ in range(count):
+            board = chess.Board()
+            while not board.is_game_over() and board.ply() < 120:
+                board.push(rng.choice(list(board.legal_moves)))
+            game = chess.pgn.Game.from_board(board)
+            game.headers["Result"] = board.result() if board.is_game_over() else rng.choice(["1-0", "0-1", "1/2-1/2"])
+            print(game, file=pgn, end="\n\n")
+
+
+@pytest.fixture
+def random_games() -> Callable[..., None]:
+    """Provide the writer of random games to a PGN file, called with the path and the number of games (6 by default)."""
+    return write_random_games
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Run uci_minimax.py on a test suite of EPD positions with best move (bm) or avoid move (am) opcodes.
+
+Each position is searched by a fresh Engine with a fixed time or node limit, the positions are spread over a
+process pool. The report gives the solved count, the time to solution (from the first iteration whose best move
+solves the position and stays so) and the speed. The results can be written as JSON and compared with the JSON
+of an earlier run, node limits make runs comparable between commits on any machine.
+"""
+import json
+import multiprocessing
+import sys
+import time
+from collections.abc import Sequence
+from typing import Any, Callable, Optional
+import chess
+
+import uci_minimax
+
+# The opcodes of chess.Board.set_epd: moves for bm and am, strings for id
+OPERATIONS_TYPE = dict[str, Any]
+POSITION_TYPE = tuple[str, OPERATIONS_TYPE]
+# A JSON-ready report of one position or of a run
+RESULT_TYPE = dict[str, Any]
+
+
+def read_suite(path: str) -> list[POSITION_TYPE]:
+    """Read the (fen, operations) of the positions of an EPD file, skipping the ones without bm or am."""
+    positions: list[POSITION_TYPE] = []
+    with open(path) as suite:
+        for line in suite:
+            if not line.strip() or line.startswith("#"):
+                continue
+            board = chess.Board()
+            operations = board.set_epd(line)
+            if "bm" in operations or "am" in operations:
+                positions.append((board.fen(), operations))
+    return positions
+
+
+def solves(operations: OPERATIONS_TYPE, move: chess.Move) -> bool:
+    """Tell whether a move is one of the best moves and none of the moves to avoid."""
+    return (move in operations.get("bm", [move])) and move not in operations.get("am", [])
+
+
+def solve(position: POSITION_TYPE, move_time: Optional[float] = None, node_limit: Optional[int] = None,
+          depth: int = uci_minimax.MAX_PLY) -> RESULT_TYPE:
+    """Search one position and return its result as a JSON-ready dict."""
+    fen, operations = position
+    board = chess.Board(fen)
+    iterations: list[tuple[float, chess.Move]] = []
+
+    def output(line: str) -> None:
+        tokens = line.split()
+        if tokens[:2] == ["info", "depth"] and "pv" in tokens and tokens.index("pv") + 1 < len(tokens):
+            iterations.append((int(tokens[tokens.index("time") + 1]) / 1000,
+                               chess.Move.from_uci(tokens[tokens.index("pv") + 1])))
+
+    start_time = time.perf_counter()
+    best_move, search = uci_minimax.Engine().search(board, depth, node_limit=node_limit, move_time=move_time,
+                                                    output=output)
+    elapsed = time.perf_counter() - start_time
+    solved = best_move is not None and solves(operations, best_move)
+    time_to_solution = None
+    if solved:
+        time_to_solution = elapsed
+        for seconds, move in reversed(iterations):
+            if not solves(operations, move):
+                break
+            time_to_solution = seconds
+    return {
+        "id": operations.get("id", fen),
+        "fen": fen,
+        "bm": [board.san(move) for move in operations.get("bm", [])],
+        "am": [board.san(move) for move in operations.get("am", [])],
+        "move": board.san(best_move) if best_move is not None else None,
+        "solved": solved,
+        "time_to_solution": time_to_solution,
+        "depth": search.depth,
+        "nodes": search.nodes,
+        "time": elapsed,
+        "nps": int(search.nodes / max(elapsed, 1e-6)),
+    }
+
+
+def _solve(arguments: tuple[POSITION_TYPE, Optional[float], Optional[int], int]) -> RESULT_TYPE:
+    """Pool.imap takes one argument."""
+    return solve(*arguments)
+
+
+def run(positions: Sequence[POSITION_TYPE], move_time: Optional[float] = None, node_limit: Optional[int] = None,
+        depth: int = uci_minimax.MAX_PLY, processes: Optional[int] = None,
+        output: Callable[[str], None] = print) -> list[RESULT_TYPE]:
+    """Search all the positions in a process pool, report each one as it finishes and return the results."""
+    results = []
+    with multiprocessing.Pool(processes) as pool:
+        tasks = [(position, move_time, node_limit, depth) for position in positions]
+        for index, result in enumerate(pool.imap(_solve, tasks), start=1):
+            results.append(result)
+            expected = f"bm {' '.join(result['bm'])}" if result["bm"] else f"am {' '.join(result['am'])}"
+            solution = f"{result['time_to_solution']:.2f}s" if result["solved"] else "-"
+            output(f"{index:4}/{len(positions)} {'ok  ' if result['solved'] else 'fail'} {result['id']}: {expected}, "
+                   f"played {result['move']}, solved at {solution}, depth {result['depth']}, {result['nps']} nps")
+    return results
+
+
+def summary(results: Sequence[RESULT_TYPE]) -> RESULT_TYPE:
+    """Add up the results of a run."""
+    solved = [result for result in results if result["solved"]]
+    nodes = sum(result["nodes"] for result in results)
+    elapsed = sum(result["time"] for result in results)
+    return {
+        "positions": len(results),
+        "solved": len(solved),
+        "total_time_to_solution": sum(result["time_to_solution"] for result in solved),
+        "nodes": nodes,
+        "time": elapsed,
+        "nps": int(nodes / max(elapsed, 1e-6)),
+    }
+
+
+def compare(results: Sequence[RESULT_TYPE], baseline: RESULT_TYPE, output: Callable[[str], None] = print) -> None:
+    """Report the positions solved in only one of two runs, matched by id."""
+    before = {result["id"]: result["solved"] for result in baseline["results"]}
+    for result in results:
+        if result["id"] in before and before[result["id"]] != result["solved"]:
+            output(f"{'now solved' if result['solved'] else 'no longer solved'}: {result['id']}")
+    output(f"solved {summary(results)['solved']} (baseline {baseline['summary']['solved']})")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run uci_minimax.py on an EPD test suite.")
+    parser.add_argument("suite", help="EPD file with bm or am opcodes.")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--movetime", type=float, help="Seconds per position (default 1 without --nodes).")
+    limit.add_argument("--nodes", type=int, help="Nodes per position, the same on every machine.")
+    parser.add_argument("--depth", type=int, default=uci_minimax.MAX_PLY, help="Maximum depth per position.")
+    parser.add_argument("--processes", type=int, help="Positions searched at the same time (default: all CPUs).")
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the JSON file of an earlier run.")
+    args = parser.parse_args()
+
+    move_time = args.movetime if args.movetime is not None or args.nodes is not None else 1.0
+    results = run(read_suite(args.suite), move_time, args.nodes, args.depth, args.processes)
+    totals = summary(results)
+    print(f"Solved {totals['solved']}/{totals['positions']}, time to solution {totals['total_time_to_solution']:.2f}s, "  # noqa: T201
+          f"{totals['nodes']} nodes in {totals['time']:.2f}s, {totals['nps']} nps")
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(results, json.load(baseline))
+    if args.json:
+        limits = {"movetime": move_time, "nodes": args.nodes, "depth": args.depth}
+        with open(args.json, "w") as report:
+            json.dump({"suite": args.suite, "limits": limits, "summary": totals, "results": results}, report, indent=2)
+    sys.stdout.flush()
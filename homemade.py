@@ -4,11 +4,15 @@ Some example classes for people who want to create a homemade bot.
 With these classes, bot makers will not have to implement the UCI or XBoard interfaces themselves.
 """
 import chess
-from chess.engine import PlayResult, Limit
+from chess.engine import PlayResult, Limit, PovScore, Cp, Mate
 import random
 from lib.engine_wrapper import MinimalEngine
-from lib.lichess_types import MOVE, HOMEMADE_ARGS_TYPE
+from lib.lichess_types import MOVE, HOMEMADE_ARGS_TYPE, COMMANDS_TYPE, OPTIONS_GO_EGTB_TYPE
+from lib.config import Configuration
+from lib import model
+from typing import Optional, cast
 import logging
+import uci_minimax
 
 
 # Use this logger variable to print messages to the console or log files.
@@ -94,3 +98,65 @@ class ComboEngine(ExampleEngine):
             possible_moves.sort(key=str)
             move = possible_moves[0]
         return PlayResult(move, None, draw_offered=draw_offered)
+
+
+class Minimaxeur(ExampleEngine):
+    """
+    Le Minimaxeur searching in the lichess-bot process, without the UCI round trip.
+
+    The `homemade_options` are the UCI options of uci_minimax.py (e.g. `Hash: 256`).
+    """
+
+    def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_GO_EGTB_TYPE, stderr: Optional[int],
+                 draw_or_resign: Configuration, game: Optional[model.Game] = None, name: Optional[str] = None,
+                 **popen_args: str) -> None:
+        """Create the engine state of this game and apply the `homemade_options`."""
+        super().__init__(commands, options, stderr, draw_or_resign, game, name, **popen_args)
+        self.minimaxeur = uci_minimax.Engine()
+        for option_name, value in options.items():
+            uci_value = ("true" if value else "false") if isinstance(value, bool) else str(value)
+            try:
+                self.minimaxeur.set_option(option_name, uci_value)
+            except ValueError as error:
+                logger.warning(error)
+
+    def search(self, board: chess.Board, *args: HOMEMADE_ARGS_TYPE) -> PlayResult:
+        """
+        Search the position with uci_minimax.
+
+        :param board: The current position.
+        :param args: The time limit, whether the engine can ponder, whether the bot was offered a draw and the root moves.
+        :return: The move to play.
+        """
+        time_limit = self.add_go_commands(cast(Limit, args[0]))
+        draw_offered = cast(bool, args[2])
+        root_moves = cast(MOVE, args[3])
+        move_time = float(time_limit.time) if time_limit.time is not None else None
+        clock = time_limit.white_clock if board.turn == chess.WHITE else time_limit.black_clock
+        total_time_remaining = float(clock) if clock is not None else float("inf")
+        depth = time_limit.depth or (uci_minimax.MAX_PLY if time_limit.nodes else
+                                     self.minimaxeur.options["Search Depth"])
+
+        best_move, search = self.minimaxeur.search(board.copy(), depth, total_time_remaining,
+                                                   root_moves if isinstance(root_moves, list) else None,
+                                                   time_limit.nodes, move_time, logger.debug)
+        if best_move is None:
+            best_move = next(iter(board.legal_moves))
+
+        kind, amount = uci_minimax.relative_score(search.best_value, board.turn)
+        score = PovScore(Mate(amount) if kind == "mate" else Cp(amount), board.turn)
+        elapsed = search.elapsed()
+        result = PlayResult(best_move, None, info={"depth": search.depth,
+                                                   "seldepth": search.seldepth,
+                                                   "score": score,
+                                                   "nodes": search.nodes,
+                                                   "nps": int(search.nodes / max(elapsed, 1e-6)),
+                                                   "time": elapsed,
+                                                   "hashfull": search.tt.hashfull(),
+                                                   "pv": search.pv})
+        self.scores.append(score)
+        result = self.offer_draw_or_resign(result, board)
+        if draw_offered and score.relative.score(mate_score=40000) <= 0:
+            # Accept the draw when we are not better
+            result.draw_offered = True
+        return result
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Generate the king and pawn versus king bitbase by retrograde analysis.
+
+Positions are normalised with White owning the pawn on the files a-d. The bitbase has one bit per position,
+set when White wins, indexed by kpk_index. It is written zlib-compressed as kpk_bitbase.py, which
+uci_minimax.py loads at startup; scripts/build_minimax.sh generates it before bundling the engine.
+"""
+import base64
+import sys
+import zlib
+from collections.abc import Iterator, Sequence
+import chess
+
+# 2 sides to move x 64 black king squares x 64 white king squares x 4 pawn files x 6 pawn ranks
+SIZE = 2 * 64 * 64 * 4 * 6
+
+INVALID = 0
+UNKNOWN = 1
+DRAW = 2
+WIN = 4
+
+
+def kpk_index(white_to_move: bool, white_king: chess.Square, pawn: chess.Square, black_king: chess.Square) -> int:
+    """Bit of a normalised position: White has the pawn, on the files a-d."""
+    return ((0 if white_to_move else 1) | black_king << 1 | white_king << 7 | chess.square_file(pawn) << 13
+            | (6 - chess.square_rank(pawn)) << 15)
+
+
+def positions() -> Iterator[tuple[int, bool, chess.Square, chess.Square, chess.Square]]:
+    """Yield (index, white_to_move, white_king, pawn, black_king) of all the bitbase entries."""
+    for index in range(SIZE):
+        white_to_move = not index & 1
+        black_king = (index >> 1) & 63
+        white_king = (index >> 7) & 63
+        pawn = chess.square((index >> 13) & 3, 6 - (index >> 15))
+        yield index, white_to_move, white_king, pawn, black_king
+
+
+def initial_result(white_to_move: bool, white_king: chess.Square, pawn: chess.Square, black_king: chess.Square) -> int:
+    """Score what does not need the successors: illegal positions, safe promotions, stalemates and captures."""
+    push = pawn + 8
+    if (chess.square_distance(white_king, black_king) <= 1 or pawn in (white_king, black_king)
+            or (white_to_move and chess.BB_PAWN_ATTACKS[chess.WHITE][pawn] & chess.BB_SQUARES[black_king])):
+        return INVALID
+    if (white_to_move and chess.square_rank(pawn) == 6 and white_king != push
+            and (chess.square_distance(black_king, push) > 1 or chess.square_distance(white_king, push) == 1)):
+        return WIN
+    if not white_to_move:
+        escapes = chess.BB_KING_ATTACKS[black_king] & ~(chess.BB_KING_ATTACKS[white_king]
+                                                        | chess.BB_PAWN_ATTACKS[chess.WHITE][pawn])
+        undefended_pawn = chess.BB_KING_ATTACKS[black_king] & chess.BB_SQUARES[pawn] & ~chess.BB_KING_ATTACKS[white_king]
+        if not escapes or undefended_pawn:
+            return DRAW
+    return UNKNOWN
+
+
+def successors(white_to_move: bool, white_king: chess.Square, pawn: chess.Square, black_king: chess.Square) -> list[int]:
+    """List the indices of the positions after each king move and pawn push, illegal ones included (they are INVALID)."""
+    if white_to_move:
+        result = [kpk_index(False, square, pawn, black_king) for square in chess.SquareSet(chess.BB_KING_ATTACKS[white_king])]
+        # Promotions are scored by initial_result
+        if chess.square_rank(pawn) < 6:
+            result.append(kpk_index(False, white_king, pawn + 8, black_king))
+        if chess.square_rank(pawn) == 1 and pawn + 8 not in (white_king, black_king):
+            result.append(kpk_index(False, white_king, pawn + 16, black_king))
+        return result
+    return [kpk_index(True, white_king, pawn, square) for square in chess.SquareSet(chess.BB_KING_ATTACKS[black_king])]
+
+
+def generate() -> list[int]:
+    """Solve all the positions, the ones still unknown at the fixed point are draws."""
+    results = [INVALID] * SIZE
+    unknown: list[tuple[int, int, list[int]]] = []
+    for index, white_to_move, white_king, pawn, black_king in positions():
+        results[index] = initial_result(white_to_move, white_king, pawn, black_king)
+        if results[index] == UNKNOWN:
+            unknown.append((index, WIN if white_to_move else DRAW, successors(white_to_move, white_king, pawn, black_king)))
+    changed = True
+    while changed:
+        changed = False
+        remaining: list[tuple[int, int, list[int]]] = []
+        for index, good, moves in unknown:
+            seen = 0
+            for move in moves:
+                seen |= results[move]
+            # The side to move picks its good result if it can, it is stuck with the bad one if it must
+            if seen & good:
+                results[index] = good
+                changed = True
+            elif seen & UNKNOWN:
+                remaining.append((index, good, moves))
+            else:
+                results[index] = WIN + DRAW - good
+                changed = True
+        unknown = remaining
+    return results
+
+
+def pack(results: Sequence[int]) -> bytes:
+    """Pack one bit per position, set for the White wins."""
+    bits = bytearray(SIZE // 8)
+    for index, result in enumerate(results):
+        if result == WIN:
+            bits[index >> 3] |= 1 << (index & 7)
+    return bytes(bits)
+
+
+def write_module(bitbase: bytes, path: str) -> None:
+    """Write the packed bitbase as a compressed Python module."""
+    encoded = base64.b64encode(zlib.compress(bitbase, 9)).decode()
+    lines = ['"""KPK bitbase generated by kpk.py, loaded by uci_minimax.py at startup."""',
+             "import base64", "import zlib", "", "KPK_BITBASE = zlib.decompress(base64.b64decode("]
+    lines += [f'    "{encoded[start:start + 100]}"' for start in range(0, len(encoded), 100)]
+    lines += ["))", ""]
+    with open(path, "w") as module:
+        module.write("\n".join(lines))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate the KPK bitbase of uci_minimax.py.")
+    parser.add_argument("--output", default="kpk_bitbase.py", help="Module to write (default kpk_bitbase.py).")
+    args = parser.parse_args()
+
+    bitbase = pack(generate())
+    write_module(bitbase, args.output)
+    print(f"Wrote {args.output}: {sum(bin(byte).count('1') for byte in bitbase)} wins, "  # noqa: T201
+          f"{len(zlib.compress(bitbase, 9))} bytes compressed")
+    sys.stdout.flush()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+A tiny NNUE-style evaluation: HalfKP inputs, one hidden layer of int16 weights, updated incrementally.
+
+Each side has an accumulator, the sum of the weights of its active features (a non-king piece on a square,
+seen from the side's king square, flipped for Black) plus the bias. The search pushes and pops the
+accumulators with the moves, only the pieces that moved are added and subtracted, the side whose king moved is
+recomputed. The score is read from the clipped accumulators of the side to move then the other side.
+
+`python nnue.py positions.bin` fits a network to the scores of a position_dataset.py file and writes the .npz
+file the engine loads with the UCI options `Use NNUE` and `EvalFile`.
+"""
+import sys
+from collections.abc import Sequence
+from typing import Callable, Optional, cast
+import chess
+import numpy as np
+import numpy.typing as npt
+
+import position_dataset
+
+# King square x (5 piece types x 2 colors) x piece square
+FEATURES = 64 * 10 * 64
+HIDDEN = 32
+# The hidden activations are clipped to [0, QA], the output weights are scaled by QB
+QA = 127
+QB = 64
+
+ACCUMULATOR_TYPE = npt.NDArray[np.int32]
+
+
+def feature_index(perspective: chess.Color, king_square: chess.Square, piece: chess.Piece, square: chess.Square) -> int:
+    """Input of a non-king piece seen from the king of `perspective`."""
+    if perspective == chess.BLACK:
+        king_square ^= 56
+        square ^= 56
+    piece_index = 2 * (piece.piece_type - 1) + (0 if piece.color == perspective else 1)
+    return (king_square * 10 + piece_index) * 64 + square
+
+
+def active_features(board: chess.Board, perspective: chess.Color) -> list[int]:
+    """List the inputs of all the non-king pieces of a board from the king of `perspective`."""
+    king_square = cast(chess.Square, board.king(perspective))
+    return [feature_index(perspective, king_square, piece, square) for square, piece in board.piece_map().items()
+            if piece.piece_type != chess.KING]
+
+
+class Network:
+    """Quantized weights of the network."""
+
+    def __init__(self, feature_weights: npt.ArrayLike, feature_bias: npt.ArrayLike, output_weights: npt.ArrayLike,
+                 output_bias: float) -> None:
+        """Quantize the weights to int16, raise ValueError if the layers are not the ones of HalfKP."""
+        self.feature_weights = np.asarray(feature_weights, dtype=np.int16)
+        self.feature_bias = np.asarray(feature_bias, dtype=np.int16)
+        self.output_weights = np.asarray(output_weights, dtype=np.int16).astype(np.int32)
+        self.output_bias = int(output_bias)
+        if self.feature_weights.shape[0] != FEATURES or self.output_weights.shape != (2 * len(self.feature_bias),):
+            raise ValueError("The network does not have HalfKP inputs and one hidden layer")
+
+    @classmethod
+    def load(cls, path: str) -> "Network":
+        """Read a network saved by `save`."""
+        with np.load(path) as weights:
+            return cls(weights["feature_weights"], weights["feature_bias"], weights["output_weights"],
+                       weights["output_bias"])
+
+    def save(self, path: str) -> None:
+        """Write the network as an .npz file."""
+        with open(path, "wb") as file:
+            np.savez(file, feature_weights=self.feature_weights, feature_bias=self.feature_bias,
+                     output_weights=self.output_weights.astype(np.int16), output_bias=np.int32(self.output_bias))
+
+    def refresh(self, board: chess.Board, perspective: chess.Color) -> ACCUMULATOR_TYPE:
+        """Compute the accumulator of one side from scratch."""
+        features = active_features(board, perspective)
+        weights: ACCUMULATOR_TYPE = self.feature_weights[features].sum(axis=0, dtype=np.int32)
+        return weights + self.feature_bias
+
+    def output(self, accumulators: Sequence[ACCUMULATOR_TYPE], turn: chess.Color) -> int:
+        """Compute the white-relative score in centipawns of the accumulators of a position."""
+        hidden = np.clip(np.concatenate((accumulators[int(turn)], accumulators[int(not turn)])), 0, QA)
+        score = (int(hidden @ self.output_weights) + self.output_bias) * 100 // (QA * QB)
+        return score if turn == chess.WHITE else -score
+
+    def evaluate_board(self, board: chess.Board) -> int:
+        """Score a board for White, without an accumulator."""
+        return self.output([self.refresh(board, chess.BLACK), self.refresh(board, chess.WHITE)], board.turn)
+
+    def accumulator(self, board: chess.Board) -> "Accumulator":
+        """Start an accumulator stack for a search from `board`."""
+        return Accumulator(self, board)
+
+
+class Accumulator:
+    """The accumulators of the positions of the current line of the search, with the root first."""
+
+    def __init__(self, network: Network, board: chess.Board) -> None:
+        """Compute the accumulators of the root position `board`."""
+        self.network = network
+        # Indexed by color: Black then White, None when the side's king moved and it needs a refresh
+        self.stack: list[list[Optional[ACCUMULATOR_TYPE]]] = [[network.refresh(board, chess.BLACK),
+                                                               network.refresh(board, chess.WHITE)]]
+
+    def current(self, board: chess.Board) -> list[ACCUMULATOR_TYPE]:
+        """Return the accumulators of the position on the board, which must be the last one pushed."""
+        accumulators = self.stack[-1]
+        for color in chess.COLORS:
+            if accumulators[color] is None:
+                accumulators[color] = self.network.refresh(board, color)
+        return cast(list[ACCUMULATOR_TYPE], accumulators)
+
+    def push(self, board: chess.Board, move: chess.Move) -> None:
+        """Update the accumulators for `move`, before it is played on the board."""
+        parent = self.current(board)
+        piece = cast(chess.Piece, board.piece_at(move.from_square))
+        removed = [(piece, move.from_square)]
+        added = [(chess.Piece(move.promotion, piece.color) if move.promotion else piece, move.to_square)]
+        if board.is_en_passant(move):
+            captured_square = move.to_square - 8 if piece.color == chess.WHITE else move.to_square + 8
+            removed.append((chess.Piece(chess.PAWN, not piece.color), captured_square))
+        elif board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            rook_from, rook_to = (7, 5) if chess.square_file(move.to_square) > chess.square_file(move.from_square) else (0, 3)
+            removed.append((chess.Piece(chess.ROOK, piece.color), chess.square(rook_from, rank)))
+            added.append((chess.Piece(chess.ROOK, piece.color), chess.square(rook_to, rank)))
+        elif (captured := board.piece_at(move.to_square)) is not None:
+            removed.append((captured, move.to_square))
+
+        weights = self.network.feature_weights
+        accumulators: list[Optional[ACCUMULATOR_TYPE]] = [None, None]
+        for color in chess.COLORS:
+            if piece.piece_type == chess.KING and piece.color == color:
+                continue
+            king_square = cast(chess.Square, board.king(color))
+            values = parent[color].copy()
+            for changed, square in removed:
+                if changed.piece_type != chess.KING:
+                    values -= weights[feature_index(color, king_square, changed, square)]
+            for changed, square in added:
+                if changed.piece_type != chess.KING:
+                    values += weights[feature_index(color, king_square, changed, square)]
+            accumulators[color] = values
+        self.stack.append(accumulators)
+
+    def pop(self) -> None:
+        """Go back to the accumulators before the last move."""
+        self.stack.pop()
+
+    def evaluate(self, board: chess.Board) -> int:
+        """Score the position on the board for White."""
+        return self.network.output(self.current(board), board.turn)
+
+
+def random_network(hidden: int = HIDDEN, seed: int = 0) -> Network:
+    """Draw a network with small random weights, for tests and as the start of the training."""
+    rng = np.random.default_rng(seed)
+    return Network(rng.integers(-16, 17, (FEATURES, hidden)), rng.integers(0, 33, hidden),
+                   rng.integers(-32, 33, 2 * hidden), 0)
+
+
+def training_inputs(boards: Sequence[chess.Board]) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """Return the padded feature indices of the side to move and the other side, FEATURES pads."""
+    us = np.full((len(boards), 30), FEATURES, dtype=np.int64)
+    them = np.full((len(boards), 30), FEATURES, dtype=np.int64)
+    for row, board in enumerate(boards):
+        for indices, color in ((us, board.turn), (them, not board.turn)):
+            features = active_features(board, color)
+            indices[row, :len(features)] = features
+    return us, them
+
+
+def train(dataset: position_dataset.PositionDataset, hidden: int = HIDDEN, epochs: int = 10, batch_size: int = 1024,
+          learning_rate: float = 1e-3, seed: int = 0, output: Callable[[str], None] = print) -> Network:
+    """
+    Fit a network to the scores of a position dataset and return it.
+
+    The float network works in pawns with activations clipped to [0, 1], the error is the squared difference
+    of the sigmoids of its output and of the score, so that mate scores do not dominate.
+    """
+    rng = np.random.default_rng(seed)
+    boards = list(dataset.boards())
+    scores = np.array(dataset.scores(), dtype=np.float32) / 100
+    targets = np.where([board.turn for board in boards], scores, -scores)
+    us, them = training_inputs(boards)
+    parameters = {
+        # The extra row is the padding input, it stays zero
+        "feature_weights": np.vstack([rng.normal(0, 0.1, (FEATURES, hidden)), np.zeros((1, hidden))]).astype(np.float32),
+        "feature_bias": np.full(hidden, 0.5, dtype=np.float32),
+        "output_weights": rng.normal(0, 0.1, 2 * hidden).astype(np.float32),
+        "output_bias": np.zeros(1, dtype=np.float32),
+    }
+    moments = {name: (np.zeros_like(value), np.zeros_like(value)) for name, value in parameters.items()}
+    step = 0
+    for epoch in range(1, epochs + 1):
+        order = rng.permutation(len(boards))
+        total_error = 0.0
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            weights = parameters["feature_weights"]
+            accumulators = np.concatenate((weights[us[batch]].sum(axis=1), weights[them[batch]].sum(axis=1)), axis=1)
+            accumulators += np.concatenate((parameters["feature_bias"], parameters["feature_bias"]))
+            hidden_values = np.clip(accumulators, 0, 1)
+            predicted = 1 / (1 + np.exp(-(hidden_values @ parameters["output_weights"] + parameters["output_bias"]) / 4))
+            target = 1 / (1 + np.exp(-targets[batch] / 4))
+            total_error += float(np.sum((predicted - target) ** 2))
+
+            slope = 2 * (predicted - target) * predicted * (1 - predicted) / 4 / len(batch)
+            hidden_slope = np.outer(slope, parameters["output_weights"]) * ((accumulators > 0) & (accumulators < 1))
+            feature_gradient = np.zeros_like(weights)
+            np.add.at(feature_gradient, us[batch], hidden_slope[:, None, :hidden])
+            np.add.at(feature_gradient, them[batch], hidden_slope[:, None, hidden:])
+            feature_gradient[FEATURES] = 0
+            gradients = {
+                "feature_weights": feature_gradient,
+                "feature_bias": hidden_slope[:, :hidden].sum(axis=0) + hidden_slope[:, hidden:].sum(axis=0),
+                "output_weights": slope @ hidden_values,
+                "output_bias": np.array([slope.sum()], dtype=np.float32),
+            }
+            # Adam
+            step += 1
+            for name, gradient in gradients.items():
+                first, second = moments[name]
+                first *= 0.9
+                first += 0.1 * gradient
+                second *= 0.999
+                second += 0.001 * gradient ** 2
+                parameters[name] -= (learning_rate * (first / (1 - 0.9 ** step))
+                                     / (np.sqrt(second / (1 - 0.999 ** step)) + 1e-8))
+        output(f"epoch {epoch} error {total_error / max(len(boards), 1):.6f}")
+
+    limit = np.iinfo(np.int16)
+    return Network(np.clip(np.rint(parameters["feature_weights"][:FEATURES] * QA), limit.min, limit.max),
+                   np.clip(np.rint(parameters["feature_bias"] * QA), limit.min, limit.max),
+                   np.clip(np.rint(parameters["output_weights"] * QB), limit.min, limit.max),
+                   np.rint(parameters["output_bias"][0] * QA * QB))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the NNUE evaluation on a position dataset.")
+    parser.add_argument("dataset", help="position_dataset.py file with the scores to learn.")
+    parser.add_argument("-o", "--output", default="minimaxeur.npz", help="Network file to write (default minimaxeur.npz).")
+    parser.add_argument("--hidden", type=int, default=HIDDEN, help=f"Hidden layer size (default {HIDDEN}).")
+    parser.add_argument("--epochs", type=int, default=10, help="Passes over the dataset (default 10).")
+    args = parser.parse_args()
+
+    network = train(position_dataset.PositionDataset(args.dataset), args.hidden, args.epochs)
+    network.save(args.output)
+    print(f"Wrote {args.output}")  # noqa: T201
+    sys.stdout.flush()
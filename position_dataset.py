@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Packed binary files of positions with their game result and evaluation, 32 bytes per position.
+
+A file is a 16-byte header followed by RECORD_DTYPE records. The pieces are stored as the occupancy bitboard
+and one 4-bit code per occupied square, in square order. `write` converts PGN files in parallel, the reader
+maps the file in memory and hands out NumPy views, the batch_eval bitboards and chess.Board objects, and `dump`
+prints the positions as EPD for the EPD tools.
+"""
+import functools
+import glob
+import multiprocessing
+import os
+import sys
+from collections.abc import Iterable, Iterator
+from typing import Any, Optional
+import chess
+import chess.pgn
+import numpy as np
+import numpy.typing as npt
+
+import uci_minimax
+
+MAGIC = b"LMXPOS\x00\x01"
+HEADER_SIZE = 16
+RECORD_DTYPE = np.dtype([
+    ("occupied", "<u8"),
+    # Codes of the occupied squares, two per byte, low nibble first: piece_type, plus 6 for Black
+    ("pieces", "u1", (16,)),
+    # Bit 0: White to move, bits 1-4: castling rights h1, a1, h8, a8
+    ("flags", "u1"),
+    # En passant square, 64 if none
+    ("ep_square", "u1"),
+    # White-relative evaluation in centipawns
+    ("score", "<i2"),
+    # 0 Black won, 1 draw, 2 White won
+    ("result", "u1"),
+    ("halfmove_clock", "u1"),
+    # Legal moves of the side to move, for the mobility term
+    ("moves", "u1"),
+    ("reserved", "u1"),
+])
+assert RECORD_DTYPE.itemsize == 32
+CASTLING_SQUARES = [chess.H1, chess.A1, chess.H8, chess.A8]
+# Evaluations are clamped to int16, mates score this much
+MATE_VALUE = 32000
+
+RESULTS = {"1-0": 1.0, "1/2-1/2": 0.5, "0-1": 0.0}
+# Book moves say nothing about the evaluation
+SKIP_PLIES = 8
+
+RECORDS_TYPE = npt.NDArray[np.void]
+
+
+def is_quiet(board: chess.Board) -> bool:
+    """Tell whether the evaluation of a position can be trusted without a search: no check and no winning capture."""
+    if board.is_check() or board.is_game_over():
+        return False
+    attacks = uci_minimax.AttackMap(board)
+    return not any((board.is_capture(move) or move.promotion) and uci_minimax.see(board, move, attacks) > 0
+                   for move in board.legal_moves)
+
+
+def encode(board: chess.Board, result: float, score: int) -> RECORDS_TYPE:
+    """Pack a position, its result (1, 0.5 or 0 for White) and its white-relative score into a record."""
+    record = np.zeros((), dtype=RECORD_DTYPE)
+    record["occupied"] = board.occupied
+    pieces = record["pieces"]
+    for index, (_, piece) in enumerate(sorted(board.piece_map().items())):
+        pieces[index // 2] |= (piece.piece_type + (0 if piece.color else 6)) << (4 * (index % 2))
+    flags = 1 if board.turn == chess.WHITE else 0
+    for bit, square in enumerate(CASTLING_SQUARES, start=1):
+        if board.castling_rights & chess.BB_SQUARES[square]:
+            flags |= 1 << bit
+    record["flags"] = flags
+    record["ep_square"] = 64 if board.ep_square is None else board.ep_square
+    record["score"] = max(-MATE_VALUE, min(MATE_VALUE, score))
+    record["result"] = round(2 * result)
+    record["halfmove_clock"] = min(board.halfmove_clock, 255)
+    record["moves"] = min(board.legal_moves.count(), 255)
+    return record
+
+
+def decode(record: np.void) -> chess.Board:
+    """Rebuild the chess.Board of a record."""
+    board = chess.Board(None)
+    codes = [(byte >> shift) & 0x0F for byte in record["pieces"].tolist() for shift in (0, 4)]
+    for code, square in zip(codes, chess.scan_forward(int(record["occupied"]))):
+        board.set_piece_at(square, chess.Piece(code - 6 if code > 6 else code, code <= 6))
+    flags = int(record["flags"])
+    board.turn = bool(flags & 1)
+    board.castling_rights = 0
+    for bit, square in enumerate(CASTLING_SQUARES, start=1):
+        if flags & (1 << bit):
+            board.castling_rights |= chess.BB_SQUARES[square]
+    board.ep_square = None if record["ep_square"] == 64 else int(record["ep_square"])
+    board.halfmove_clock = int(record["halfmove_clock"])
+    return board
+
+
+def static_score(board: chess.Board) -> int:
+    """Evaluate with uci_minimax a position the games did not score."""
+    return max(-MATE_VALUE, min(MATE_VALUE, int(uci_minimax.evaluate_board(board))))
+
+
+def read_pgn_records(path: str, skip_plies: int = SKIP_PLIES, quiet_only: bool = True,
+                     evaluate: bool = True) -> RECORDS_TYPE:
+    """
+    Read the records of the positions of the finished games of a PGN file.
+
+    The score is the [%eval] lichess-bot wrote for the move if any, else the static evaluation (0 if `evaluate`
+    is false). Only the quiet positions are kept if `quiet_only`.
+    """
+    records: list[RECORDS_TYPE] = []
+    with open(path, encoding="utf-8", errors="replace") as pgn:
+        while (game := chess.pgn.read_game(pgn)) is not None:
+            result = RESULTS.get(game.headers.get("Result", "*"))
+            if result is None:
+                continue
+            # One running board, node.board() would replay the game from the start at every move
+            board = game.board()
+            for ply, node in enumerate(game.mainline(), start=1):
+                board.push(node.move)
+                if ply < skip_plies or (quiet_only and not is_quiet(board)):
+                    continue
+                pov_score = node.eval()
+                if pov_score is not None:
+                    score = pov_score.white().score(mate_score=MATE_VALUE)
+                else:
+                    score = static_score(board) if evaluate else 0
+                records.append(encode(board, result, score))
+    return np.array(records, dtype=RECORD_DTYPE)
+
+
+def pgn_paths(paths: Iterable[str]) -> list[str]:
+    """List the PGN files given, the directories being searched recursively."""
+    found: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += sorted(glob.glob(os.path.join(path, "**", "*.pgn"), recursive=True))
+        else:
+            found.append(path)
+    return found
+
+
+def write(paths: Iterable[str], output: str, processes: Optional[int] = None, **options: Any) -> int:
+    """Convert PGN files (or directories of them) to a dataset file in parallel, return the number of positions."""
+    count = 0
+    with open(output, "wb") as dataset, multiprocessing.Pool(processes) as pool:
+        dataset.write(MAGIC + RECORD_DTYPE.itemsize.to_bytes(4, "little") + bytes(HEADER_SIZE - len(MAGIC) - 4))
+        # imap keeps the order of the files and does not hold all their records at once
+        for records in pool.imap(functools.partial(read_pgn_records, **options), pgn_paths(paths)):
+            dataset.write(records.tobytes())
+            count += len(records)
+    return count
+
+
+def records_bitboards(records: RECORDS_TYPE) -> npt.NDArray[np.uint64]:
+    """Decode the (N, 12) batch_eval bitboards of records, decoded with NumPy."""
+    occupied = np.ascontiguousarray(records["occupied"], dtype="<u8")
+    squares = np.unpackbits(occupied.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    pieces = records["pieces"]
+    nibbles = np.empty((len(records), 32), dtype=np.uint8)
+    nibbles[:, 0::2] = pieces & 0x0F
+    nibbles[:, 1::2] = pieces >> 4
+    # The n-th occupied square has the n-th code
+    codes = np.take_along_axis(nibbles, np.maximum(np.cumsum(squares, axis=1) - 1, 0), axis=1) * squares
+    planes = codes[:, None, :] == np.arange(1, 13, dtype=np.uint8)[None, :, None]
+    return np.packbits(planes, axis=2, bitorder="little").view("<u8").reshape(-1, 12)
+
+
+class PositionDataset:
+    """A dataset file mapped in memory, the fields are NumPy views on it."""
+
+    def __init__(self, path: str) -> None:
+        """Map the dataset file at `path`, raise ValueError if it is not one."""
+        with open(path, "rb") as dataset:
+            header = dataset.read(HEADER_SIZE)
+        if header[:len(MAGIC)] != MAGIC or int.from_bytes(header[8:12], "little") != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a position dataset")
+        self.records: RECORDS_TYPE
+        count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self) -> int:
+        """Count the positions."""
+        return len(self.records)
+
+    def scores(self) -> npt.NDArray[np.int16]:
+        """Return the white-relative evaluations."""
+        return self.records["score"]
+
+    def results(self) -> npt.NDArray[np.float64]:
+        """Return the game results for White: 1, 0.5 or 0."""
+        return self.records["result"] / 2
+
+    def mobility(self) -> npt.NDArray[np.int64]:
+        """Return the legal moves of the side to move, negative with Black to move."""
+        moves = self.records["moves"].astype(np.int64)
+        return np.where(self.records["flags"] & 1, moves, -moves)
+
+    def bitboards(self, start: int = 0, stop: Optional[int] = None) -> npt.NDArray[np.uint64]:
+        """Decode the batch_eval bitboards of a slice of the positions."""
+        return records_bitboards(self.records[start:stop])
+
+    def boards(self, start: int = 0, stop: Optional[int] = None) -> Iterator[chess.Board]:
+        """Yield the chess.Board of a slice of the positions."""
+        for record in self.records[start:stop]:
+            yield decode(record)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write and read packed position datasets.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    write_parser = subparsers.add_parser("write", help="Convert PGN files or directories to a dataset.")
+    write_parser.add_argument("pgn", nargs="+", help="PGN files or directories, such as lichess-bot's pgn_directory.")
+    write_parser.add_argument("-o", "--output", required=True, help="Dataset file to write.")
+    write_parser.add_argument("--processes", type=int, help="Processes reading the PGN files (default: all CPUs).")
+    write_parser.add_argument("--all-positions", action="store_true", help="Keep the positions that are not quiet.")
+    dump_parser = subparsers.add_parser("dump", help="Print the positions of a dataset as EPD.")
+    dump_parser.add_argument("dataset", help="Dataset file to read.")
+    dump_parser.add_argument("--limit", type=int, help="Print only the first positions.")
+    args = parser.parse_args()
+
+    if args.command == "write":
+        count = write(args.pgn, args.output, args.processes, quiet_only=not args.all_positions)
+        print(f"Wrote {count} positions to {args.output}")  # noqa: T201
+    else:
+        dataset = PositionDataset(args.dataset)
+        results = {0: "0-1", 1: "1/2-1/2", 2: "1-0"}
+        for board, record in zip(dataset.boards(0, args.limit), dataset.records[:args.limit]):
+            score = int(record["score"])
+            print(board.epd(ce=score if board.turn else -score, c0=results[int(record["result"])]))  # noqa: T201
+        sys.stdout.flush()
@@ -1 +1 @@
-pyinstaller --onefile --distpath engines uci_minimax.py
\ No newline at end of file
+python kpk.py && pyinstaller --onefile --distpath engines uci_minimax.py
\ No newline at end of file
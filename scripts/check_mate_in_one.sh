@@ -9,7 +9,7 @@ uci
 isready
 ucinewgame
 $POSITION
-go depth 5
+go mate 1
 quit
 EOF
 )
@@ -10,7 +10,7 @@ uci
 isready
 ucinewgame
 $POSITION
-go depth 5
+go mate 2
 quit
 EOF
 )
@@ -0,0 +1,53 @@
+"""Tests for the NumPy batch evaluation."""
+import random
+import chess
+import pytest
+import uci_minimax
+
+np = pytest.importorskip("numpy")
+batch_eval = pytest.importorskip("batch_eval")
+
+
+def random_positions(count_per_start: int = 20) -> list[chess.Board]:
+    """Play random moves from the bench positions."""
+    rng = random.Random(1)
+    boards = []
+    for fen in uci_minimax.BENCH_POSITIONS:
+        board = chess.Board(fen)
+        for _ in range(count_per_start):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+            boards.append(board.copy(stack=False))
+    return boards
+
+
+def test_planes() -> None:
+    """Test that the planes are the pieces of the board."""
+    board = chess.Board()
+    planes = batch_eval.bitboards_to_planes(batch_eval.board_bitboards([board]))
+    assert planes.shape == (1, 12, 64)
+    for index, (color, piece_type) in enumerate(batch_eval.PLANES):
+        assert list(np.flatnonzero(planes[0, index])) == list(board.pieces(piece_type, color))
+
+
+def test_batch_matches_evaluate_board() -> None:
+    """Test that the batch scores are evaluate_board less the mobility term."""
+    endgames = [chess.Board(fen) for fen in ("8/8/8/4k3/8/8/R7/4K3 w - - 0 1", "8/8/8/4k3/8/8/8/q3K3 b - - 0 1",
+                                             "8/8/8/4k3/8/8/P7/4K3 w - - 0 1", "8/8/8/4k3/8/8/R7/4K2r w - - 0 1")]
+    boards = random_positions() + endgames
+    scores = batch_eval.evaluate_batch(boards)
+    assert scores.dtype == np.int64
+    for board, score in zip(boards, scores):
+        if board.is_game_over():
+            continue
+        if uci_minimax.evaluate_endgame(board) is not None:
+            # The specialised evaluations have no mobility term
+            assert score == uci_minimax.evaluate_board(board)
+            continue
+        mobility = uci_minimax.MOBILITY_WEIGHT * board.legal_moves.count()
+        assert score == uci_minimax.evaluate_board(board) - (mobility if board.turn else -mobility)
+    assert list(batch_eval.specialised_endgames(batch_eval.board_bitboards(endgames))) == [True, True, True, False]
+    assert list(batch_eval.game_phase(batch_eval.bitboards_to_planes(batch_eval.board_bitboards(boards)))) == \
+        [uci_minimax.game_phase(board) for board in boards]
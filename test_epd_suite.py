@@ -0,0 +1,73 @@
+"""Tests for the EPD test suite runner."""
+import json
+import os
+import subprocess
+import sys
+import chess
+import epd_suite
+
+SUITE = """# Two positions
+6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - bm Rd8#; id "back rank";
+r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - am Qxe5+; id "scholar";
+8/8/8/8/8/8/8/K1k5 w - - id "no opcode";
+"""
+
+
+def write_suite(path: str) -> str:
+    """Write the test suite and return its path."""
+    suite = os.path.join(path, "suite.epd")
+    with open(suite, "w") as epd:
+        epd.write(SUITE)
+    return suite
+
+
+def test_read_suite_and_solves(tmp_path: str) -> None:
+    """Test the bm, am and id opcodes and the solution check."""
+    positions = epd_suite.read_suite(write_suite(str(tmp_path)))
+    assert len(positions) == 2
+    (fen, operations), (_, avoid) = positions
+    assert chess.Board(fen).fullmove_number == 1
+    assert operations["id"] == "back rank" and operations["bm"] == [chess.Move.from_uci("d1d8")]
+    assert avoid["id"] == "scholar" and avoid["am"] == [chess.Move.from_uci("h5e5")]
+    assert epd_suite.solves(operations, chess.Move.from_uci("d1d8"))
+    assert not epd_suite.solves(operations, chess.Move.from_uci("g1f1"))
+    assert epd_suite.solves(avoid, chess.Move.from_uci("h5f7"))
+    assert not epd_suite.solves(avoid, chess.Move.from_uci("h5e5"))
+
+
+def test_run_summary_and_compare(tmp_path: str) -> None:
+    """Test a node-limited run in the pool, its totals and the comparison with a baseline."""
+    positions = epd_suite.read_suite(write_suite(str(tmp_path)))
+    lines: list[str] = []
+    results = epd_suite.run(positions, node_limit=300, processes=2, output=lines.append)
+    assert len(lines) == 2 and [result["id"] for result in results] == ["back rank", "scholar"]
+    assert results[0]["solved"] and results[0]["move"] == "Rd8#" and results[0]["bm"] == ["Rd8#"]
+    assert results[0]["time_to_solution"] <= results[0]["time"]
+    assert all(result["nodes"] <= 300 for result in results)
+
+    totals = epd_suite.summary(results)
+    assert totals["positions"] == 2 and totals["solved"] == sum(result["solved"] for result in results)
+    assert totals["nodes"] == sum(result["nodes"] for result in results)
+
+    baseline = {"summary": dict(totals, solved=0), "results": [dict(result, solved=False) for result in results]}
+    lines = []
+    epd_suite.compare(results, baseline, output=lines.append)
+    assert "now solved: back rank" in lines
+    assert lines[-1] == f"solved {totals['solved']} (baseline 0)"
+
+
+def test_command_line_json(tmp_path: str) -> None:
+    """Test that the command line writes the JSON report and compares with it."""
+    suite = write_suite(str(tmp_path))
+    report = os.path.join(tmp_path, "results.json")
+    command = [sys.executable, "epd_suite.py", suite, "--nodes", "200", "--processes", "1", "--json", report]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout  # noqa: S603
+    assert "Solved " in output
+    with open(report) as results:
+        data = json.load(results)
+    assert data["limits"]["nodes"] == 200 and data["limits"]["movetime"] is None
+    assert data["summary"]["positions"] == len(data["results"]) == 2
+
+    output = subprocess.run(command[:-2] + ["--baseline", report],  # noqa: S603
+                            check=True, capture_output=True, text=True).stdout
+    assert f"(baseline {data['summary']['solved']})" in output
@@ -0,0 +1,105 @@
+"""Tests for the NNUE evaluation."""
+import os
+import random
+from typing import Any
+import chess
+import pytest
+import uci_minimax
+
+np = pytest.importorskip("numpy")
+nnue = pytest.importorskip("nnue")
+position_dataset = pytest.importorskip("position_dataset")
+
+
+def test_incremental_accumulator() -> None:
+    """Test that the accumulators updated move by move match the ones computed from scratch."""
+    network = nnue.random_network()
+    rng = random.Random(5)
+    fens = uci_minimax.BENCH_POSITIONS + ["rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+                                          "8/1P4k1/8/8/8/8/6Kp/8 w - - 0 1"]
+    for fen in fens:
+        board = chess.Board(fen)
+        accumulator = network.accumulator(board)
+        for _ in range(40):
+            if board.is_game_over():
+                break
+            move = rng.choice(list(board.legal_moves))
+            accumulator.push(board, move)
+            board.push(move)
+            assert accumulator.evaluate(board) == network.evaluate_board(board)
+        while board.move_stack:
+            accumulator.pop()
+            board.pop()
+        assert len(accumulator.stack) == 1
+        assert accumulator.evaluate(board) == network.evaluate_board(board)
+
+
+def test_network_is_symmetric() -> None:
+    """Test that both sides share the weights, the mirrored position has the opposite score."""
+    network = nnue.random_network()
+    for fen in uci_minimax.BENCH_POSITIONS:
+        board = chess.Board(fen)
+        assert network.evaluate_board(board) == -network.evaluate_board(board.mirror())
+
+
+def test_engine_option(tmp_path: str) -> None:
+    """Test that the engine loads the network from EvalFile and evaluates with it."""
+    path = os.path.join(tmp_path, "network.npz")
+    network = nnue.random_network()
+    network.save(path)
+    engine = uci_minimax.Engine()
+    engine.set_option("EvalFile", path)
+    assert engine.network is None
+    engine.set_option("Use NNUE", "true")
+    assert engine.network is not None
+    assert (engine.network.feature_weights == network.feature_weights).all()
+
+    board = chess.Board(uci_minimax.BENCH_POSITIONS[1])
+    search = uci_minimax.SearchInfo(network=engine.network)
+    search.accumulator = engine.network.accumulator(board)
+    assert uci_minimax.evaluate(board, search) == network.evaluate_board(board)
+    best_move, search = engine.search(board, 2, output=lambda _: None)
+    assert best_move is not None and best_move in board.legal_moves
+    assert search.accumulator is not None and len(search.accumulator.stack) == 1
+
+    # A missing file is refused and the network in use stays
+    with pytest.raises(ValueError, match="Cannot load the network"):
+        engine.set_option("EvalFile", os.path.join(tmp_path, "missing.npz"))
+    assert engine.options["EvalFile"] == path and engine.network is not None
+    engine.set_option("Use NNUE", "false")
+    assert engine.network is None
+    engine.set_option("EvalFile", os.path.join(tmp_path, "missing.npz"))
+    with pytest.raises(ValueError, match="Cannot load the network"):
+        engine.set_option("Use NNUE", "true")
+    assert not engine.options["Use NNUE"]
+
+
+def test_training(tmp_path: str) -> None:
+    """Test that the trainer fits the scores of a dataset better than a random network."""
+    rng = random.Random(7)
+    records: list[Any] = []
+    while len(records) < 300:
+        board = chess.Board()
+        for _ in range(rng.randrange(4, 40)):
+            if board.is_game_over():
+                break
+            board.push(rng.choice(list(board.legal_moves)))
+        if not board.is_game_over():
+            records.append(position_dataset.encode(board, 0.5, position_dataset.static_score(board)))
+    path = os.path.join(tmp_path, "positions.bin")
+    with open(path, "wb") as dataset:
+        header = position_dataset.MAGIC + position_dataset.RECORD_DTYPE.itemsize.to_bytes(4, "little")
+        dataset.write(header.ljust(position_dataset.HEADER_SIZE, b"\0"))
+        dataset.write(np.array(records, dtype=position_dataset.RECORD_DTYPE).tobytes())
+    dataset = position_dataset.PositionDataset(path)
+
+    network = nnue.train(dataset, hidden=8, epochs=30, batch_size=64, learning_rate=1e-2, output=lambda _: None)
+    scores = dataset.scores().astype(np.float64)
+
+    def error(network: Any) -> float:
+        predicted = np.array([network.evaluate_board(board) for board in dataset.boards()])
+        return float(np.mean((1 / (1 + np.exp(-predicted / 400)) - 1 / (1 + np.exp(-scores / 400))) ** 2))
+
+    assert error(network) < error(nnue.random_network(hidden=8))
+    network.save(os.path.join(tmp_path, "network.npz"))
+    assert nnue.Network.load(os.path.join(tmp_path, "network.npz")).output_bias == network.output_bias
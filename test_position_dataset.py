@@ -0,0 +1,62 @@
+"""Tests for the packed position datasets."""
+import os
+from typing import Callable
+import chess
+import chess.pgn
+import pytest
+import uci_minimax
+
+np = pytest.importorskip("numpy")
+batch_eval = pytest.importorskip("batch_eval")
+position_dataset = pytest.importorskip("position_dataset")
+
+
+def test_record_round_trip() -> None:
+    """Test that a record gives back the position, result and score."""
+    fens = uci_minimax.BENCH_POSITIONS + ["rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w Kq f6 0 3"]
+    records = np.array([position_dataset.encode(chess.Board(fen), 0.5, -123) for fen in fens],
+                       dtype=position_dataset.RECORD_DTYPE)
+    assert position_dataset.RECORD_DTYPE.itemsize == 32
+    for fen, record in zip(fens, records):
+        board = chess.Board(fen)
+        decoded = position_dataset.decode(record)
+        assert decoded.epd(en_passant="fen") == board.epd(en_passant="fen")
+        assert decoded.halfmove_clock == board.halfmove_clock
+        assert record["moves"] == board.legal_moves.count()
+    assert (records["score"] == -123).all()
+    assert (records["result"] == 1).all()
+    assert (position_dataset.records_bitboards(records) == batch_eval.board_bitboards(chess.Board(fen) for fen in fens)).all()
+
+
+def test_write_and_read(tmp_path: str, random_games: Callable[..., None]) -> None:
+    """Test the parallel PGN conversion and the memory-mapped reader."""
+    for name in ("a.pgn", "b.pgn"):
+        random_games(os.path.join(tmp_path, name))
+    path = os.path.join(tmp_path, "positions.bin")
+    count = position_dataset.write([str(tmp_path)], path, processes=2)
+    dataset = position_dataset.PositionDataset(path)
+    assert len(dataset) == count > 100
+    assert os.path.getsize(path) == position_dataset.HEADER_SIZE + 32 * count
+    assert isinstance(dataset.records, np.memmap)
+
+    boards = list(dataset.boards(0, 50))
+    assert all(position_dataset.is_quiet(board) for board in boards)
+    assert list(dataset.scores()[:50]) == [position_dataset.static_score(board) for board in boards]
+    assert set(dataset.results()) <= {0.0, 0.5, 1.0}
+    assert list(dataset.mobility()[:50]) == [board.legal_moves.count() * (1 if board.turn else -1) for board in boards]
+    assert (dataset.bitboards(0, 50) == batch_eval.board_bitboards(boards)).all()
+
+    with pytest.raises(ValueError, match="is not a position dataset"):
+        position_dataset.PositionDataset(os.path.join(tmp_path, "a.pgn"))
+
+
+def test_pgn_positions(tmp_path: str, random_games: Callable[..., None]) -> None:
+    """Test that the running board of the PGN reader gives the position after each move of the game."""
+    path = os.path.join(tmp_path, "a.pgn")
+    random_games(path, count=2)
+    records = position_dataset.read_pgn_records(path, skip_plies=1, quiet_only=False, evaluate=False)
+    expected = []
+    with open(path) as pgn:
+        while (game := chess.pgn.read_game(pgn)) is not None:
+            expected += [node.board().epd() for node in game.mainline()]
+    assert [position_dataset.decode(record).epd() for record in records] == expected
@@ -0,0 +1,68 @@
+"""Tests for the Texel tuner."""
+import os
+import subprocess
+import sys
+from typing import Callable
+import chess
+import pytest
+import uci_minimax
+
+np = pytest.importorskip("numpy")
+batch_eval = pytest.importorskip("batch_eval")
+texel_tuner = pytest.importorskip("texel_tuner")
+position_dataset = pytest.importorskip("position_dataset")
+
+
+def test_tuner(tmp_path: str, monkeypatch: pytest.MonkeyPatch, random_games: Callable[..., None]) -> None:
+    """Test that the tuner reads the games, models the engine evaluation, lowers the error and writes a module."""
+    os.makedirs(os.path.join(tmp_path, "games"))
+    random_games(os.path.join(tmp_path, "games", "a.pgn"))
+    random_games(os.path.join(tmp_path, "games", "b.pgn"))
+    bitboards, mobility, results = texel_tuner.load_dataset(os.path.join(tmp_path, "games"), processes=2)
+    assert len(bitboards) == len(mobility) == len(results) > 100
+
+    # The tapered score is floored by the engine, the model is not
+    dataset = texel_tuner.FeatureChunks(bitboards, mobility, results)
+    model = np.concatenate([chunk.evaluate(texel_tuner.initial_parameters()) for chunk, _ in dataset])
+    engine = batch_eval.evaluate_planes(batch_eval.bitboards_to_planes(bitboards)) + uci_minimax.MOBILITY_WEIGHT * mobility
+    assert np.abs(model - engine).max() < 1
+
+    # The gradient of the sparse features is the one of the error
+    parameters = texel_tuner.initial_parameters()
+    gradient = texel_tuner.error_and_gradient(parameters, 1.0, dataset)[1]
+    square = max(range(texel_tuner.PST_OFFSET, texel_tuner.PAWN_STRUCTURE_INDEX), key=lambda index: abs(gradient[index]))
+    for index in (chess.KNIGHT - 1, square, texel_tuner.PAWN_STRUCTURE_INDEX, texel_tuner.MOBILITY_INDEX):
+        assert gradient[index] != 0
+        step = np.zeros(texel_tuner.PARAMETER_COUNT)
+        step[index] = 1e-3
+        slope = (texel_tuner.error_and_gradient(parameters + step, 1.0, dataset)[0]
+                 - texel_tuner.error_and_gradient(parameters - step, 1.0, dataset)[0]) / 2e-3
+        assert gradient[index] == pytest.approx(slope, rel=1e-4, abs=1e-12)
+
+    parameters, k, error = texel_tuner.tune(bitboards, mobility, results, epochs=20, output=lambda _: None)
+    initial_error = texel_tuner.error_and_gradient(texel_tuner.initial_parameters(), k, dataset)[0]
+    assert error < initial_error
+
+    # The sums do not depend on the chunking
+    monkeypatch.setattr(texel_tuner, "CHUNK_SIZE", 50)
+    small_chunks = texel_tuner.FeatureChunks(bitboards, mobility, results)
+    assert len(list(small_chunks)) == len(list(small_chunks)) == -(-len(results) // 50)
+    assert texel_tuner.error_and_gradient(texel_tuner.initial_parameters(), k, small_chunks)[0] == \
+        pytest.approx(initial_error)
+
+    texel_tuner.write_parameters(parameters, os.path.join(tmp_path, "tuned_parameters.py"))
+    check = ("import uci_minimax, tuned_parameters; "
+             "assert uci_minimax.MATERIAL_VALUES is tuned_parameters.MATERIAL_VALUES; "
+             "assert uci_minimax.MOBILITY_WEIGHT == tuned_parameters.MOBILITY_WEIGHT; "
+             "assert len(uci_minimax.pst_2d[1]) == 8")
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), os.getcwd()]))
+    subprocess.run([sys.executable, "-c", check], check=True, env=environment)  # noqa: S603
+
+
+def test_dataset_leaves_out_specialised_endgames() -> None:
+    """Test that the positions evaluate_board scores without the tuned parameters are not tuned on."""
+    boards = [chess.Board("8/8/8/4k3/8/8/R7/4K3 w - - 0 1"), chess.Board(), chess.Board("8/8/8/4k3/8/8/8/q3K3 b - - 0 1")]
+    records = np.array([position_dataset.encode(board, 0.5, 0) for board in boards], dtype=position_dataset.RECORD_DTYPE)
+    bitboards, mobility, results = texel_tuner.dataset_arrays(records)
+    assert (bitboards == batch_eval.board_bitboards([chess.Board()])).all()
+    assert list(mobility) == [20] and list(results) == [0.5]
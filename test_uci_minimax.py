@@ -0,0 +1,564 @@
+"""Tests for the minimax engine."""
+import os
+import runpy
+import subprocess
+import sys
+import time
+from typing import Any
+import chess
+import chess.syzygy
+import pytest
+from chess.engine import Limit
+import uci_minimax
+from homemade import Minimaxeur
+from lib.config import Configuration
+
+# lichess-bot starts one engine process per game, so the UCI handshake eats into the first move
+STARTUP_TIME_TARGET = 1.0
+
+
+def test_perft_suite() -> None:
+    """Test the move generation against the known perft counts."""
+    for _, fen, expected_counts in uci_minimax.PERFT_SUITE:
+        board = chess.Board(fen)
+        for depth, expected in enumerate(expected_counts[:2], start=1):
+            assert uci_minimax.perft(board, depth) == expected
+        assert board.fen() == fen
+
+
+def test_perft_divide() -> None:
+    """Test that the divide output adds up to the perft count."""
+    board = chess.Board()
+    divide = uci_minimax.perft_divide(board, 3)
+    assert len(divide) == 20
+    assert sum(nodes for _, nodes in divide) == 8902
+    assert dict(divide)[chess.Move.from_uci("e2e4")] == 600
+
+
+def test_search_is_deterministic() -> None:
+    """Test that a fixed-depth search always visits the same number of nodes, as the bench signature relies on it."""
+    node_counts = set()
+    for _ in range(2):
+        board = chess.Board(uci_minimax.BENCH_POSITIONS[3])
+        search = uci_minimax.SearchInfo()
+        uci_minimax.find_best_move_iterative(board, 2, float("inf"), search)
+        node_counts.add(search.nodes)
+    assert len(node_counts) == 1
+    assert node_counts.pop() > 0
+
+
+def test_uci_score() -> None:
+    """Test the conversion of search values to UCI scores."""
+    assert uci_minimax.uci_score(35, chess.WHITE) == "cp 35"
+    assert uci_minimax.uci_score(35, chess.BLACK) == "cp -35"
+    assert uci_minimax.uci_score(uci_minimax.MATE_SCORE - 1, chess.WHITE) == "mate 1"
+    assert uci_minimax.uci_score(uci_minimax.MATE_SCORE - 3, chess.BLACK) == "mate -2"
+
+
+def test_search_info_mate_in_one() -> None:
+    """Test that the search reports the mate score and the principal variation."""
+    board = chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4")
+    search = uci_minimax.SearchInfo()
+    best_move = uci_minimax.find_best_move_iterative(board, 2, float("inf"), search)
+    assert best_move == chess.Move.from_uci("h5f7")
+    assert search.pv[0] == best_move
+    assert uci_minimax.uci_score(search.best_value, board.turn) == "mate 1"
+    assert search.seldepth >= 1
+
+
+def run_uci(commands: str) -> list[str]:
+    """Send UCI commands to an engine process and return its output lines."""
+    result = subprocess.run([sys.executable, "uci_minimax.py"], input=commands + "quit\n",  # noqa: S603
+                            capture_output=True, text=True, check=True)
+    return result.stdout.splitlines()
+
+
+def test_stopped_search_reports_finite_mate() -> None:
+    """Test that a mate found by the evaluation of a stopped search is reported with its distance."""
+    board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+    board.push(chess.Move.from_uci("d1d8"))
+    assert uci_minimax.evaluate_board(board) == uci_minimax.MATE_SCORE
+    assert uci_minimax.evaluate_terminal(board, 1) == uci_minimax.MATE_SCORE - 1
+    for go in ("go nodes 1", "go movetime 1"):
+        lines = run_uci(f"position fen 6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1\n{go}\n")
+        scores = [line.split(" score ")[1].split(" nodes ")[0] for line in lines if " score " in line]
+        assert scores and all(score == "mate 1" for score in scores)
+        assert "bestmove d1d8" in lines
+        # Both searches stop long before the Search Depth
+        depths = [int(line.split()[2]) for line in lines if line.startswith("info depth")]
+        assert max(depths) < 3
+
+
+def test_parse_setoption() -> None:
+    """Test the parsing of setoption commands."""
+    assert uci_minimax.parse_setoption("setoption name Profile value true") == ("Profile", "true")
+    assert uci_minimax.parse_setoption("setoption name Debug Log File value a b.log") == ("Debug Log File", "a b.log")
+    assert uci_minimax.parse_setoption("setoption name Clear Hash") == ("Clear Hash", None)
+
+
+def test_profiling_counters() -> None:
+    """Test that the search fills the profiling counters."""
+    search = uci_minimax.SearchInfo()
+    uci_minimax.find_best_move_iterative(chess.Board(), 2, float("inf"), search)
+    assert search.evals > 0
+    assert search.eval_time > 0
+    assert search.ordering_time > 0
+    assert search.movegen_time > 0
+
+
+def test_import_has_no_side_effects() -> None:
+    """Test that importing the engine neither configures logging nor pulls in chess.engine."""
+    check = ("import logging, sys, uci_minimax; "
+             "assert not logging.getLogger().handlers; assert 'chess.engine' not in sys.modules")
+    subprocess.run([sys.executable, "-c", check], check=True)  # noqa: S603
+
+
+def test_nnue_without_numpy(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that turning the NNUE on without NumPy is refused like a missing network, not a crash."""
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    monkeypatch.setitem(sys.modules, "nnue", None)
+    engine = uci_minimax.Engine()
+    engine.set_option("EvalFile", "network.npz")
+    with pytest.raises(ValueError, match="Cannot load the network"):
+        engine.set_option("Use NNUE", "true")
+    assert engine.network is None
+
+
+def test_startup_time() -> None:
+    """Test that the engine answers the UCI handshake quickly."""
+    start_time = time.perf_counter()
+    with subprocess.Popen([sys.executable, "uci_minimax.py"],  # noqa: S603
+                          stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) as engine:
+        assert engine.stdin is not None
+        assert engine.stdout is not None
+        engine.stdin.write("uci\nisready\n")
+        engine.stdin.flush()
+        while engine.stdout.readline().strip() != "readyok":
+            pass
+        elapsed = time.perf_counter() - start_time
+        engine.stdin.write("quit\n")
+        engine.stdin.flush()
+    assert elapsed < STARTUP_TIME_TARGET
+
+
+def test_searchmoves() -> None:
+    """Test that go searchmoves restricts the root moves."""
+    board = chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4")
+    tokens = ["go", "wtime", "1000", "searchmoves", "h5h4", "b1c3", "e1e3", "depth", "2"]
+    root_moves = uci_minimax.parse_searchmoves(board, tokens)
+    assert root_moves == [chess.Move.from_uci("h5h4"), chess.Move.from_uci("b1c3")]
+
+    search = uci_minimax.SearchInfo(root_moves=root_moves)
+    assert uci_minimax.find_best_move_iterative(board, 2, float("inf"), search) in root_moves
+
+    search = uci_minimax.SearchInfo(root_moves=root_moves[:1])
+    assert uci_minimax.find_best_move_iterative(board, 3, float("inf"), search) == root_moves[0]
+    assert search.nodes < 100
+
+
+def test_node_limit() -> None:
+    """Test that go nodes stops at exactly the node limit and always gives the same result."""
+    results = set()
+    for _ in range(2):
+        board = chess.Board(uci_minimax.BENCH_POSITIONS[6])
+        search = uci_minimax.SearchInfo(node_limit=500)
+        best_move = uci_minimax.find_best_move_iterative(board, uci_minimax.MAX_PLY, float("inf"), search)
+        assert search.nodes == 500
+        assert search.stopped
+        results.add((best_move, search.nodes, tuple(search.pv)))
+    assert len(results) == 1
+
+
+def test_movetime() -> None:
+    """Test that go movetime searches for the given time, not to the Search Depth."""
+    for milliseconds in (50, 300):
+        lines = run_uci(f"position startpos\ngo movetime {milliseconds}\n")
+        stats = next(line for line in lines if line.startswith("info string stats"))
+        assert milliseconds / 1000 <= float(stats.split()[4].rstrip("s")) < milliseconds / 1000 + 0.5
+        assert any(line.startswith("bestmove") for line in lines)
+
+
+def test_repeated_node_limit() -> None:
+    """Test that the same go nodes gives the same result again in one session, whatever the tables hold."""
+    lines = run_uci("position startpos moves e2e4\ngo nodes 2000\ngo nodes 2000\n")
+    results: list[list[tuple[str, str]]] = [[]]
+    for line in lines:
+        if line.startswith("info depth"):
+            tokens = line.split()
+            results[-1].append((tokens[tokens.index("nodes") + 1], line.split(" pv ")[1]))
+        elif line.startswith("bestmove"):
+            results[-1].append(("bestmove", line.split()[1]))
+            results.append([])
+    assert len(results) == 3 and results[0] == results[1]
+
+
+def test_multipv() -> None:
+    """Test that the MultiPV lines are the best moves with their exact scores."""
+    board = chess.Board(uci_minimax.BENCH_POSITIONS[6])
+    values = []
+    for move in board.legal_moves:
+        board.push(move)
+        values.append(uci_minimax.minimax(board, 1, -float("inf"), float("inf"), board.turn, uci_minimax.SearchInfo()))
+        board.pop()
+
+    search = uci_minimax.SearchInfo(multipv=3)
+    # The frontier pruning trades exact scores for speed
+    search.futility_pruning = search.reverse_futility_pruning = search.razoring = False
+    uci_minimax.find_best_move_iterative(board, 2, float("inf"), search)
+    assert [value for value, _ in search.lines] == sorted(values, reverse=board.turn == chess.WHITE)[:3]
+    assert search.pv == search.lines[0][1]
+
+
+def test_frontier_pruning() -> None:
+    """Test that each frontier pruning technique saves nodes and still finds the mate."""
+    board = chess.Board(uci_minimax.BENCH_POSITIONS[1])
+    node_counts = {}
+    for technique in (None, "futility_pruning", "reverse_futility_pruning", "razoring"):
+        search = uci_minimax.SearchInfo()
+        search.futility_pruning = search.reverse_futility_pruning = search.razoring = False
+        if technique is not None:
+            setattr(search, technique, True)
+        uci_minimax.find_best_move_iterative(board, 3, float("inf"), search)
+        node_counts[technique] = search.nodes
+    assert all(nodes < node_counts[None] for technique, nodes in node_counts.items() if technique is not None)
+
+    board = chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4")
+    search = uci_minimax.SearchInfo()
+    assert uci_minimax.find_best_move_iterative(board, 3, float("inf"), search) == chess.Move.from_uci("h5f7")
+    assert uci_minimax.uci_score(search.best_value, board.turn) == "mate 1"
+
+
+def test_internal_iterative_deepening(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the reduced searches at nodes without a hash move only change the move order, not the value."""
+    monkeypatch.setattr(uci_minimax, "IID_DEPTH", 3)
+    for fen in uci_minimax.BENCH_POSITIONS[:5]:
+        board = chess.Board(fen)
+        results = []
+        for internal_iterative_deepening in (False, True):
+            search = uci_minimax.SearchInfo()
+            # Without pruning the alpha-beta value does not depend on the move order
+            search.futility_pruning = search.reverse_futility_pruning = search.razoring = False
+            search.internal_iterative_deepening = internal_iterative_deepening
+            value = uci_minimax.minimax(board, 3, -float("inf"), float("inf"), board.turn, search)
+            results.append((value, search.nodes))
+        assert results[0][0] == results[1][0]
+        assert results[0][1] != results[1][1]
+
+
+def test_lazy_evaluation() -> None:
+    """Test that the lazy evaluation skips the positional stage only when the full score is outside the window."""
+    search = uci_minimax.SearchInfo()
+    for fen in uci_minimax.BENCH_POSITIONS[:10]:
+        board = chess.Board(fen)
+        score = uci_minimax.evaluate_board(board)
+        assert uci_minimax.evaluate(board, search) == score
+        assert uci_minimax.evaluate(board, search, score + 2000, score + 2001) >= score
+        assert uci_minimax.evaluate(board, search, score - 2001, score - 2000) <= score
+    assert search.evals == 30
+    assert search.positional_evals == 10
+    assert search.lazy_evals == 20
+
+
+def test_tapered_evaluation() -> None:
+    """Test the game phase kept by make_move and unmake_move, and the blend of the middlegame and endgame tables."""
+    assert uci_minimax.game_phase(chess.Board()) == uci_minimax.MAX_PHASE
+    board = chess.Board(uci_minimax.BENCH_POSITIONS[1])
+    middlegame = uci_minimax.evaluate_material(board, uci_minimax.MAX_PHASE)
+    endgame = uci_minimax.evaluate_material(board, 0)
+    assert middlegame != endgame
+    assert min(middlegame, endgame) <= uci_minimax.evaluate_material(board, 12) <= max(middlegame, endgame)
+
+    # Captures, en passant and promotions
+    board = chess.Board("r3k2r/1P4P1/8/3pP3/8/8/6p1/R3K2R w KQkq d6 0 1")
+    search = uci_minimax.SearchInfo()
+    search.phase = uci_minimax.game_phase(board)
+    for uci in ["e5d6", "g2h1q", "b7a8n", "h1e1", "g7h8r"]:
+        uci_minimax.make_move(board, chess.Move.from_uci(uci), search)
+        assert search.phase == uci_minimax.game_phase(board)
+    for _ in range(5):
+        uci_minimax.unmake_move(board, search)
+        assert search.phase == uci_minimax.game_phase(board)
+    assert not search.phase_stack
+
+
+def test_attack_map() -> None:
+    """Test the attack map against python-chess and the static exchange evaluation."""
+    for fen in uci_minimax.BENCH_POSITIONS[:10]:
+        board = chess.Board(fen)
+        attacks = uci_minimax.AttackMap(board)
+        for color in chess.COLORS:
+            expected = [square for square in chess.SQUARES if board.is_attacked_by(color, square)]
+            assert list(chess.SquareSet(attacks.attacks(color))) == expected
+            pawns = board.pieces_mask(chess.PAWN, color)
+            expected = [square for square in chess.SQUARES if board.attackers_mask(color, square) & pawns]
+            assert list(chess.SquareSet(attacks.attacks(color, chess.PAWN))) == expected
+        assert attacks.checkers() == board.checkers_mask()
+
+    # The knight on d7 is pinned and cannot take back on e5
+    board = chess.Board("4k3/3n4/8/1B2p3/3P4/8/8/4K3 w - - 0 1")
+    attacks = uci_minimax.AttackMap(board)
+    assert attacks.pinned(chess.BLACK) == chess.BB_D7
+    assert uci_minimax.see(board, chess.Move.from_uci("d4e5"), attacks) == 100
+    board = chess.Board("4k3/3n4/8/4p3/3Q4/8/8/4K3 w - - 0 1")
+    assert uci_minimax.see(board, chess.Move.from_uci("d4e5"), uci_minimax.AttackMap(board)) == 100 - 900
+
+
+def test_shared_transposition_table(tmp_path: str) -> None:
+    """Test that the table file is shared by the processes, kept when closed and safe from torn writes."""
+    path = os.path.join(tmp_path, "minimaxeur.hash")
+    table = uci_minimax.SharedTranspositionTable(path, 1)
+    other = uci_minimax.SharedTranspositionTable(path, 8)
+    assert other.size == table.size == 1024 * 1024 // uci_minimax.SHARED_TT_ENTRY.size
+    key = 0x123456789ABCDEF0
+    move = chess.Move.from_uci("e7e8n")
+    table.store(key, 6, uci_minimax.LOWER_BOUND, -250, move, 3)
+    assert other.probe(key) == (6, uci_minimax.LOWER_BOUND, -250, move)
+    assert other.probe(key ^ (1 << 40)) is None
+
+    # A write from another process
+    code = ("import sys, uci_minimax; table = uci_minimax.SharedTranspositionTable(sys.argv[1]); "
+            "table.store(42, 3, uci_minimax.EXACT, uci_minimax.MATE_SCORE - 5, None, 2); table.close()")
+    subprocess.run([sys.executable, "-c", code, path], check=True)  # noqa: S603
+    assert table.probe(42) == (3, uci_minimax.EXACT, uci_minimax.MATE_SCORE - 3, None)
+
+    # Half of another entry written over the slot
+    offset = uci_minimax.SHARED_TT_HEADER_BYTES + (key & (table.size - 1)) * uci_minimax.SHARED_TT_ENTRY.size
+    table.map[offset:offset + 8] = (12345).to_bytes(8, "little")
+    assert table.probe(key) is None
+    table.close()
+    other.close()
+    assert uci_minimax.SharedTranspositionTable(path).probe(42) is not None
+
+    engine = uci_minimax.Engine()
+    engine.set_option("Shared Hash File", path)
+    _, search = engine.search(chess.Board(), 2, output=lambda _: None)
+    assert search.tt is engine.shared_tt and search.tt.hashfull() >= 0
+    engine.new_game()
+    assert engine.shared_tt.probe(42) is not None
+    with pytest.raises(ValueError, match="is not a shared transposition table"):
+        engine.set_option("Shared Hash File", __file__)
+    # The rejected file leaves the table in use
+    assert engine.options["Shared Hash File"] == path and engine.shared_tt.probe(42) is not None
+
+
+def test_bench_reuses_shared_hash_file(tmp_path: str) -> None:
+    """Test that a second bench over a kept shared hash file searches fewer nodes than the first."""
+    path = os.path.join(tmp_path, "bench.hash")
+    runs = []
+    for _ in range(2):
+        lines = subprocess.run([sys.executable, "uci_minimax.py", "bench", "--depth", "2",  # noqa: S603
+                                "--shared-hash", path],
+                               capture_output=True, text=True, check=True).stdout.splitlines()
+        runs.append(int(next(line for line in lines if line.startswith("Nodes searched")).split(":")[1]))
+    assert runs[0] == uci_minimax.run_bench(2)
+    assert runs[1] < runs[0]
+
+
+def test_eval_cache() -> None:
+    """Test the eval cache slots and that cached evaluations are the full ones."""
+    cache = uci_minimax.EvalCache(1)
+    assert cache.size == 1024 * 1024 // uci_minimax.EVAL_CACHE_ENTRY_BYTES
+    key = 0x123456789ABCDEF0
+    assert cache.probe(key) is None
+    cache.store(key, -1234)
+    assert cache.probe(key) == -1234
+    # Same slot, other position
+    assert cache.probe(key ^ (1 << 40)) is None
+    cache.clear()
+    assert cache.probe(key) is None
+
+    board = chess.Board(uci_minimax.BENCH_POSITIONS[2])
+    search = uci_minimax.SearchInfo(eval_cache=cache)
+    assert uci_minimax.evaluate(board, search, 10**6, 10**6 + 1) != uci_minimax.evaluate_board(board)
+    assert uci_minimax.evaluate(board, search) == uci_minimax.evaluate_board(board)
+    assert uci_minimax.evaluate(board, search, 10**6, 10**6 + 1) == uci_minimax.evaluate_board(board)
+    assert search.eval_cache_hits == 1
+
+    engine = uci_minimax.Engine()
+    engine.set_option("Eval Cache", "2")
+    assert engine.eval_cache.size == 2 * 1024 * 1024 // uci_minimax.EVAL_CACHE_ENTRY_BYTES
+    engine.eval_cache.store(key, 1)
+    engine.new_game()
+    assert engine.eval_cache.probe(key) is None
+
+
+class KingAndQueenTablebase(chess.syzygy.Tablebase):
+    """Stand-in for the Syzygy tables that only knows that a lone queen wins."""
+
+    def __init__(self) -> None:
+        """Start with no table files and no probes."""
+        super().__init__()
+        self.probes = 0
+
+    def probe_wdl(self, board: chess.Board) -> int:
+        """Count the probe and return the result of a king and queen against king position."""
+        self.probes += 1
+        if chess.popcount(board.occupied) != 3 or not board.queens:
+            raise KeyError("missing table")
+        return 2 if board.queens & board.occupied_co[board.turn] else -2
+
+
+def test_tablebase_probing(tmp_path: str) -> None:
+    """Test that the search scores the captures into a tablebase position with its probe result."""
+    board = chess.Board("8/8/8/3k4/8/1r6/8/1Q2K3 w - - 0 1")
+    tablebase = KingAndQueenTablebase()
+    search = uci_minimax.SearchInfo(output=lambda _: None, tablebase=tablebase)
+    assert uci_minimax.find_best_move_iterative(board, 2, float("inf"), search) == chess.Move.from_uci("b1b3")
+    assert search.best_value == uci_minimax.TB_WIN_SCORE - 1
+    assert search.tb_hits > 0 and len(search.tablebase_cache) == tablebase.probes
+
+    # The second search finds every probe in the cache
+    probes = tablebase.probes
+    search = uci_minimax.SearchInfo(output=lambda _: None, tablebase=tablebase,
+                                    tablebase_cache=search.tablebase_cache)
+    uci_minimax.find_best_move_iterative(board, 2, float("inf"), search)
+    assert tablebase.probes == probes and search.tb_hits > 0
+
+    search = uci_minimax.SearchInfo(output=lambda _: None, tablebase=tablebase)
+    search.tablebase_probe_limit = 2
+    uci_minimax.find_best_move_iterative(board, 2, float("inf"), search)
+    assert search.tb_probes == 0 and search.best_value < uci_minimax.TB_WIN_SCORE - uci_minimax.MAX_PLY
+
+    engine = uci_minimax.Engine()
+    engine.set_option("SyzygyProbeLimit", "5")
+    assert engine.search(board, 1, output=lambda _: None)[1].tablebase_probe_limit == 5
+    for path in (str(tmp_path), os.path.join(tmp_path, "missing")):
+        with pytest.raises(ValueError, match="Syzygy tables"):
+            engine.set_option("SyzygyPath", path)
+        assert engine.tablebase is None
+
+
+def test_endgame_evaluation(monkeypatch: pytest.MonkeyPatch, tmp_path: str) -> None:
+    """Test the KPK bitbase and the specialised evaluations chosen by material signature."""
+    kpk = pytest.importorskip("kpk")
+    bitbase = kpk.pack(kpk.generate())
+    assert len(bitbase) == kpk.SIZE // 8
+    path = os.path.join(tmp_path, "kpk_bitbase.py")
+    kpk.write_module(bitbase, path)
+    assert runpy.run_path(path)["KPK_BITBASE"] == bitbase
+    monkeypatch.setattr(uci_minimax, "KPK_BITBASE", bitbase)
+
+    # The pawn wins with the king in front of it, the defender holds with the opposition
+    assert uci_minimax.evaluate_board(chess.Board("4k3/8/4K3/4P3/8/8/8/8 w - - 0 1")) > uci_minimax.KNOWN_WIN_SCORE
+    assert uci_minimax.evaluate_board(chess.Board("4k3/8/4P3/4K3/8/8/8/8 w - - 0 1")) == 0
+    assert uci_minimax.evaluate_board(chess.Board("8/8/8/8/8/4K3/4p3/4k3 b - - 0 1")) < -uci_minimax.KNOWN_WIN_SCORE
+    assert uci_minimax.evaluate_board(chess.Board("8/k7/P7/8/8/8/8/K7 w - - 0 1")) == 0
+    assert uci_minimax.evaluate_board(chess.Board("8/8/8/8/8/8/k7/7K b - - 0 1")) == 0
+
+    # The lone king is worse off on the edge
+    board = chess.Board("8/8/8/4k3/8/8/R7/4K3 w - - 0 1")
+    assert uci_minimax.material_key(board) == "KRvK"
+    centre = uci_minimax.evaluate_board(board)
+    assert centre > uci_minimax.KNOWN_WIN_SCORE
+    assert uci_minimax.evaluate_board(chess.Board("4k3/8/4K3/8/8/8/R7/8 b - - 0 1")) > centre
+    assert uci_minimax.evaluate_board(board.mirror()) == -centre
+    assert uci_minimax.evaluate_endgame(chess.Board(uci_minimax.BENCH_POSITIONS[0])) is None
+
+    monkeypatch.setattr(uci_minimax, "KPK_BITBASE", None)
+    assert uci_minimax.evaluate_endgame(chess.Board("4k3/8/4K3/4P3/8/8/8/8 w - - 0 1")) is None
+
+
+def test_mate_search() -> None:
+    """Test that both mate searches find the shortest mate with the longest defence, or report none."""
+    cases = [("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", 2, ["d1d8"]),
+             ("r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 0", 2, ["d5f6", "g7f6", "c4f7"]),
+             ("r5rk/5p1p/5R2/4B3/8/8/7P/7K w - - 0 1", 3, ["f6a6", "f7f6", "e5f6", "g8g7", "a6a8"])]
+    engine = uci_minimax.Engine()
+    for proof_number in ("false", "true"):
+        engine.set_option("Proof Number Search", proof_number)
+        for fen, moves, expected in cases:
+            lines: list[str] = []
+            line, search = engine.mate(chess.Board(fen), moves, output=lines.append)
+            assert line is not None
+            assert [move.uci() for move in line] == expected
+            assert f"score mate {(len(expected) + 1) // 2} " in lines[-1]
+        lines = []
+        line, search = engine.mate(chess.Board("8/8/8/4k3/8/8/R7/4K3 w - - 0 1"), 3, output=lines.append)
+        assert line is None and lines == ["info string No mate in 3 found"]
+
+    # Checks only misses the quiet first move of this mate
+    board = chess.Board("7k/8/5K2/8/8/8/8/6R1 w - - 0 1")
+    line = uci_minimax.find_mate(board, 2, uci_minimax.SearchInfo(output=lambda _: None))
+    assert line is not None
+    assert len(line) == 3
+    assert uci_minimax.find_mate(board, 2, uci_minimax.SearchInfo(output=lambda _: None), checks_only=2) is None
+
+
+def test_go_mate() -> None:
+    """Test that go mate plays the mate, or a legal move within the clock when there is none or no number."""
+    lines = run_uci("position fen 6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1\ngo mate 1\n")
+    assert "bestmove d1d8" in lines
+    for go in ("go mate 3 wtime 2000 btime 2000", "go mate", "go mate x movetime 100"):
+        start_time = time.perf_counter()
+        lines = run_uci(f"position startpos moves e2e4\n{go}\n")
+        assert time.perf_counter() - start_time < 10
+        best_move = chess.Move.from_uci(next(line for line in lines if line.startswith("bestmove")).split()[1])
+        assert best_move in chess.Board("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1").legal_moves
+
+
+def test_uci_options() -> None:
+    """Test the UCI option registry."""
+    options = {option.name: option for option in uci_minimax.UCI_OPTIONS}
+    assert options["Hash"].uci() == "option name Hash type spin default 64 min 1 max 4096"
+    assert options["Debug Log File"].uci() == "option name Debug Log File type string default <empty>"
+    assert options["Profile"].uci() == "option name Profile type check default false"
+
+    engine = uci_minimax.Engine()
+    engine.set_option("multipv", "500")
+    assert engine.options["MultiPV"] == 256
+    with pytest.raises(ValueError, match="Invalid value for MultiPV"):
+        engine.set_option("MultiPV", "abc")
+    assert engine.options["MultiPV"] == 256
+    with pytest.raises(ValueError, match="Unknown option"):
+        engine.set_option("Contempt", "10")
+
+    engine.set_option("Hash", "1")
+    assert engine.tt.size == 1024 * 1024 // uci_minimax.TT_ENTRY_BYTES
+
+    engine.tt.store(1, 1, uci_minimax.EXACT, 0, None, 0)
+    engine.set_option("Clear Hash", None)
+    assert engine.tt.probe(1) is None
+    assert uci_minimax.Engine().options["MultiPV"] == 1
+
+
+def test_engines_are_independent() -> None:
+    """Test that two engines in the same process share no search state."""
+    first, second = uci_minimax.Engine(), uci_minimax.Engine()
+    board = chess.Board()
+    best_move, search = first.search(board, 2, output=lambda _: None)
+    assert best_move is not None
+    assert best_move in board.legal_moves
+    assert board == chess.Board()
+    assert first.tt.entries
+    assert not second.tt.entries
+    assert search.tt is first.tt
+
+
+def test_move_time_limit() -> None:
+    """Test that the time budget keeps the move overhead in reserve."""
+    assert abs(uci_minimax.move_time_limit(25.01) - 1) < 1e-9
+    assert uci_minimax.move_time_limit(0) > 0
+
+
+def test_homemade_minimaxeur() -> None:
+    """Test the in-process homemade engine honours the go commands, root moves and draw offers."""
+    draw_or_resign = Configuration({"offer_draw_enabled": False, "offer_draw_moves": 10, "offer_draw_score": 0,
+                                    "offer_draw_pieces": 10, "resign_enabled": False, "resign_moves": 3,
+                                    "resign_score": -1000})
+    # The go commands hold numbers, like the ones read from the configuration file
+    options: dict[str, Any] = {"Hash": 16, "go_commands": {"depth": 2}}
+    engine = Minimaxeur([], options, None, draw_or_resign)
+    assert engine.minimaxeur.tt.size == 16 * 1024 * 1024 // uci_minimax.TT_ENTRY_BYTES
+
+    board = chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4")
+    root_moves = [chess.Move.from_uci("h5h4"), chess.Move.from_uci("b1c3")]
+    result = engine.search(board, Limit(white_clock=60, black_clock=60), False, False, root_moves)
+    assert result.move in root_moves
+    assert result.info["depth"] == 2
+    assert not result.draw_offered
+
+    result = engine.search(board, Limit(time=1), False, True, [])
+    assert result.move == chess.Move.from_uci("h5f7")
+    assert result.info["score"].relative.mate() == 1
+    assert not result.draw_offered
+    assert len(engine.scores) == 2
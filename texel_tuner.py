@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Texel tuning of the evaluation on the games lichess-bot saved in its `pgn_directory`.
+
+The quiet positions of the games are labelled with the game result, and the middlegame material values,
+piece-square tables (pst_2d), mobility weight and pawn structure weight are fitted so that
+sigmoid(K * evaluation) predicts the results. The evaluation is linear in these parameters, so it is computed
+with the batch_eval planes and tuned by gradient descent; the positions of the specialised endgames (KPK, KRK,
+KQK), which the engine scores without these parameters, are left out. The result is written to
+tuned_parameters.py, which uci_minimax.py loads at startup.
+"""
+import functools
+import math
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import Iterator
+from typing import Callable, Optional
+import chess
+import numpy as np
+import numpy.typing as npt
+import yaml
+
+import batch_eval
+import position_dataset
+import uci_minimax
+
+# Positions per chunk, bounds the memory of the planes while the features are built
+CHUNK_SIZE = 1 << 14
+# Most pieces on a board, the piece slots of a position
+MAX_PIECES = 32
+# Flips the square index vertically, pst_2d rows start at rank 8 for White
+FLIP = np.arange(64) ^ 56
+
+# The tuned parameters: 5 material values (the king is fixed), the 6 piece-square tables and the two weights
+MATERIAL_TYPES = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]
+PST_OFFSET = len(MATERIAL_TYPES)
+PAWN_STRUCTURE_INDEX = PST_OFFSET + 6 * 64
+MOBILITY_INDEX = PAWN_STRUCTURE_INDEX + 1
+PARAMETER_COUNT = MOBILITY_INDEX + 1
+# Index of the padding slots of the features, past the parameters
+PADDING_INDEX = PARAMETER_COUNT
+
+# The (N, 12) bitboards, signed mobility and White score of the positions
+DATASET_TYPE = tuple[npt.NDArray[np.uint64], npt.NDArray[np.int64], npt.NDArray[np.float64]]
+
+
+def load_dataset(pgn_directory: str, processes: Optional[int] = None) -> DATASET_TYPE:
+    """
+    Read the quiet positions of the PGN files of a directory in parallel.
+
+    Return their (N, 12) bitboards, signed mobility (legal moves, negative with Black to move) and White score.
+    """
+    paths = position_dataset.pgn_paths([pgn_directory])
+    read = functools.partial(position_dataset.read_pgn_records, evaluate=False)
+    if paths:
+        with multiprocessing.Pool(processes) as pool:
+            records = np.concatenate(pool.map(read, paths))
+    else:
+        records = np.zeros(0, dtype=position_dataset.RECORD_DTYPE)
+    return dataset_arrays(records)
+
+
+def dataset_arrays(records: npt.NDArray[np.void]) -> DATASET_TYPE:
+    """Return the bitboards, signed mobility and White score of position_dataset records, less the specialised endgames."""
+    bitboards = position_dataset.records_bitboards(records)
+    # evaluate_board scores them without the tuned parameters
+    keep = ~batch_eval.specialised_endgames(bitboards)
+    records = records[keep]
+    moves = records["moves"].astype(np.int64)
+    return bitboards[keep], np.where(records["flags"] & 1, moves, -moves), records["result"] / 2
+
+
+def initial_parameters() -> npt.NDArray[np.float64]:
+    """Return the parameters of the engine as a vector."""
+    parameters = np.zeros(PARAMETER_COUNT)
+    for index, piece_type in enumerate(MATERIAL_TYPES):
+        parameters[index] = uci_minimax.MATERIAL_VALUES[piece_type]
+    for index, piece_type in enumerate(chess.PIECE_TYPES):
+        start = PST_OFFSET + 64 * index
+        parameters[start:start + 64] = np.array(uci_minimax.pst_2d[piece_type]).reshape(64)
+    parameters[PAWN_STRUCTURE_INDEX] = uci_minimax.PAWN_STRUCTURE_WEIGHT
+    parameters[MOBILITY_INDEX] = uci_minimax.MOBILITY_WEIGHT
+    return parameters
+
+
+class FeatureChunk:
+    """
+    The features of a chunk of positions, the evaluation is linear in the parameters.
+
+    A position has at most 32 pieces, so its piece-square and material features are kept as the parameter
+    indices of its pieces with their signs (White +1, Black -1) instead of a dense row of PARAMETER_COUNT floats.
+    Both are scaled by the middlegame share of the tapered score; the endgame share is the fixed part, which is
+    not tuned. The padding slots point at PADDING_INDEX, a parameter that is always 0.
+    """
+
+    def __init__(self, bitboards: npt.NDArray[np.uint64], mobility: npt.ArrayLike) -> None:
+        """Build the features of the positions of these (N, 12) bitboards and signed mobility."""
+        planes = batch_eval.bitboards_to_planes(bitboards)
+        phase = np.minimum(batch_eval.game_phase(planes), uci_minimax.MAX_PHASE)
+        self.middlegame_share: npt.NDArray[np.float64] = phase / uci_minimax.MAX_PHASE
+        # pst_2d[piece_type][row][file] counted for White, mirrored for Black, the two cancel on the same entry
+        squares = (planes[:, :6, FLIP].astype(np.int8) - planes[:, 6:, :].astype(np.int8)).reshape(len(planes), -1)
+        rows, columns = np.nonzero(squares)
+        starts = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(planes)))[:-1]))
+        slots = np.arange(len(rows)) - starts[rows]
+        self.squares = np.full((len(planes), MAX_PIECES), PADDING_INDEX, dtype=np.int16)
+        self.materials = np.full((len(planes), MAX_PIECES), PADDING_INDEX, dtype=np.int16)
+        self.signs = np.zeros((len(planes), MAX_PIECES), dtype=np.int8)
+        self.squares[rows, slots] = PST_OFFSET + columns
+        # The king has no material value
+        self.materials[rows, slots] = np.where(columns // 64 < PST_OFFSET, columns // 64, PADDING_INDEX)
+        self.signs[rows, slots] = squares[rows, columns]
+        self.pawn_structure = batch_eval.pawn_structure_counts(planes)
+        self.mobility = np.asarray(mobility, dtype=np.float64)
+        endgame = planes.reshape(len(planes), -1).astype(np.float64) @ batch_eval.ENDGAME_WEIGHTS.reshape(-1)
+        self.fixed: npt.NDArray[np.float64] = endgame * (1 - self.middlegame_share)
+
+    def __len__(self) -> int:
+        """Return the number of positions."""
+        return len(self.fixed)
+
+    def evaluate(self, parameters: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """White-relative evaluation of the positions with these parameters."""
+        padded = np.append(parameters, 0.0)
+        pieces: npt.NDArray[np.float64] = ((padded[self.squares] + padded[self.materials]) * self.signs).sum(axis=1)
+        return (pieces * self.middlegame_share + float(parameters[PAWN_STRUCTURE_INDEX]) * self.pawn_structure
+                + float(parameters[MOBILITY_INDEX]) * self.mobility + self.fixed)
+
+    def gradient(self, slope: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """Sum over the positions of `slope` times the features, that is slope @ features."""
+        weights = ((slope * self.middlegame_share)[:, None] * self.signs).reshape(-1)
+        # The weighted counts are floats
+        gradient = np.asarray(np.bincount(self.squares.reshape(-1), weights, minlength=PADDING_INDEX + 1)
+                              + np.bincount(self.materials.reshape(-1), weights, minlength=PADDING_INDEX + 1),
+                              dtype=np.float64)[:PARAMETER_COUNT]
+        gradient[PAWN_STRUCTURE_INDEX] += slope @ self.pawn_structure
+        gradient[MOBILITY_INDEX] += slope @ self.mobility
+        return gradient
+
+
+class FeatureChunks:
+    """
+    The dataset as chunks that can be iterated over on each pass.
+
+    The features are built once, CHUNK_SIZE positions at a time, and kept: about 200 bytes a position against
+    3 KB for a dense feature row.
+    """
+
+    def __init__(self, bitboards: npt.NDArray[np.uint64], mobility: npt.NDArray[np.int64],
+                 results: npt.NDArray[np.float64]) -> None:
+        """Build the features of the dataset."""
+        self.chunks = [(FeatureChunk(bitboards[start:start + CHUNK_SIZE], mobility[start:start + CHUNK_SIZE]),
+                        results[start:start + CHUNK_SIZE]) for start in range(0, len(results), CHUNK_SIZE)]
+
+    def __iter__(self) -> Iterator[tuple[FeatureChunk, npt.NDArray[np.float64]]]:
+        """Go over the (features, results) of the chunks."""
+        return iter(self.chunks)
+
+
+def sigmoid(evaluation: npt.NDArray[np.float64], k: float) -> npt.NDArray[np.float64]:
+    """Return the expected score of White for a white-relative evaluation in centipawns."""
+    return 1 / (1 + np.power(10, -k * evaluation / 400))
+
+
+def error_and_gradient(parameters: npt.NDArray[np.float64], k: float, dataset: FeatureChunks
+                       ) -> tuple[float, npt.NDArray[np.float64]]:
+    """Mean squared error of the predicted results and its gradient with respect to the parameters."""
+    error = 0.0
+    gradient = np.zeros(PARAMETER_COUNT)
+    count = 0
+    for chunk, results in dataset:
+        predicted = sigmoid(chunk.evaluate(parameters), k)
+        difference = predicted - results
+        error += np.sum(difference ** 2)
+        slope = 2 * difference * predicted * (1 - predicted) * k * math.log(10) / 400
+        gradient += chunk.gradient(slope)
+        count += len(results)
+    return error / max(count, 1), gradient / max(count, 1)
+
+
+def fit_k(parameters: npt.NDArray[np.float64], dataset: FeatureChunks) -> float:
+    """Scaling constant of the sigmoid that best fits the results with the current parameters."""
+    low, high = 0.05, 3.0
+    # Golden section search, the error is unimodal in K
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(30):
+        first = high - ratio * (high - low)
+        second = low + ratio * (high - low)
+        if error_and_gradient(parameters, first, dataset)[0] < error_and_gradient(parameters, second, dataset)[0]:
+            high = second
+        else:
+            low = first
+    return (low + high) / 2
+
+
+def tune(bitboards: npt.NDArray[np.uint64], mobility: npt.NDArray[np.int64], results: npt.NDArray[np.float64],
+         epochs: int = 300, learning_rate: float = 1.0, output: Callable[[str], None] = print
+         ) -> tuple[npt.NDArray[np.float64], float, float]:
+    """Return the tuned parameters, the sigmoid constant and the final error, with Adam on the full dataset."""
+    dataset = FeatureChunks(bitboards, mobility, results)
+    parameters = initial_parameters()
+    k = fit_k(parameters, dataset)
+    first_moment = np.zeros(PARAMETER_COUNT)
+    second_moment = np.zeros(PARAMETER_COUNT)
+    beta1, beta2 = 0.9, 0.999
+    error = error_and_gradient(parameters, k, dataset)[0]
+    output(f"positions {len(results)} K {k:.3f} initial error {error:.6f}")
+    for epoch in range(1, epochs + 1):
+        error, gradient = error_and_gradient(parameters, k, dataset)
+        first_moment = beta1 * first_moment + (1 - beta1) * gradient
+        second_moment = beta2 * second_moment + (1 - beta2) * gradient ** 2
+        step = first_moment / (1 - beta1 ** epoch) / (np.sqrt(second_moment / (1 - beta2 ** epoch)) + 1e-12)
+        parameters -= learning_rate * step
+        if epoch % 50 == 0 or epoch == epochs:
+            output(f"epoch {epoch} error {error:.6f}")
+    return parameters, k, error_and_gradient(parameters, k, dataset)[0]
+
+
+def write_parameters(parameters: npt.NDArray[np.float64], path: str, comment: str = "") -> None:
+    """Write the parameters as a Python module with the names uci_minimax.py uses."""
+    values = np.rint(parameters).astype(int)
+    lines = ['"""Evaluation parameters generated by texel_tuner.py, loaded by uci_minimax.py at startup."""',
+             "import chess", ""]
+    if comment:
+        lines += [f"# {comment}", ""]
+    lines.append("MATERIAL_VALUES = {")
+    for index, piece_type in enumerate(MATERIAL_TYPES):
+        lines.append(f"    chess.{chess.piece_name(piece_type).upper()}: {values[index]},")
+    lines += [f"    chess.KING: {uci_minimax.MATERIAL_VALUES[chess.KING]},", "}", "pst_2d = {"]
+    for index, piece_type in enumerate(chess.PIECE_TYPES):
+        rows = values[PST_OFFSET + 64 * index:PST_OFFSET + 64 * (index + 1)].reshape(8, 8)
+        lines.append(f"    chess.{chess.piece_name(piece_type).upper()}: [")
+        lines += [f"        {list(row)}," for row in rows.tolist()]
+        lines.append("    ],")
+    lines += ["}", f"MOBILITY_WEIGHT = {values[MOBILITY_INDEX]}",
+              f"PAWN_STRUCTURE_WEIGHT = {values[PAWN_STRUCTURE_INDEX]}", ""]
+    with open(path, "w") as module:
+        module.write("\n".join(lines))
+
+
+def configured_pgn_directory(config_file: str = "config.yml") -> Optional[str]:
+    """Return the `pgn_directory` of the lichess-bot configuration, or None."""
+    if not os.path.exists(config_file):
+        return None
+    with open(config_file) as stream:
+        pgn_directory: Optional[str] = (yaml.safe_load(stream) or {}).get("pgn_directory")
+    return pgn_directory
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tune the evaluation of uci_minimax.py on the bot's games.")
+    parser.add_argument("--pgn-directory", help="Directory of the PGN files (default: pgn_directory of config.yml).")
+    parser.add_argument("--dataset", help="Tune on a position_dataset.py file instead of PGN files.")
+    parser.add_argument("--output", default="tuned_parameters.py", help="Module to write (default tuned_parameters.py).")
+    parser.add_argument("--epochs", type=int, default=300, help="Gradient descent steps (default 300).")
+    parser.add_argument("--learning-rate", type=float, default=1.0, help="Adam step in centipawns (default 1).")
+    parser.add_argument("--processes", type=int, help="Processes reading the PGN files (default: all CPUs).")
+    args = parser.parse_args()
+
+    source = args.dataset or args.pgn_directory or configured_pgn_directory()
+    if not source:
+        sys.exit("No PGN directory, set pgn_directory in config.yml or pass --pgn-directory or --dataset")
+    start_time = time.time()
+    if args.dataset:
+        bitboards, mobility, results = dataset_arrays(position_dataset.PositionDataset(args.dataset).records)
+    else:
+        bitboards, mobility, results = load_dataset(source, args.processes)
+    print(f"Read {len(results)} quiet positions in {time.time() - start_time:.1f}s")  # noqa: T201
+    if not len(results):
+        sys.exit(f"No finished games in {source}")
+    parameters, k, error = tune(bitboards, mobility, results, args.epochs, args.learning_rate)
+    write_parameters(parameters, args.output, f"{len(results)} positions from {source}, K {k:.3f}, error {error:.6f}")
+    print(f"Wrote {args.output}")  # noqa: T201
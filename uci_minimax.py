@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
+"""Le Minimaxeur, a minimax chess engine speaking UCI."""
+from __future__ import annotations
+import array
+import itertools
+import struct
 import sys
+import os
 import chess
-import chess.engine
 import time
 import logging
-logging.basicConfig(level=logging.DEBUG)
 import chess.polyglot
+from typing import Any, Callable, Optional, TypeVar, Union, TYPE_CHECKING, cast
+
+if TYPE_CHECKING:
+    from chess.syzygy import Tablebase
+    import nnue
+
+# Nothing is configured at import, the UCI "Debug Log File" option attaches a file handler
+logger = logging.getLogger("uci_minimax")
 
 # Material values
 MATERIAL_VALUES = {
@@ -14,7 +26,7 @@ MATERIAL_VALUES = {
     chess.BISHOP: 330,
     chess.ROOK: 500,
     chess.QUEEN: 900,
-    chess.KING: 60000  
+    chess.KING: 60000
 }
 # Transform the piece-square tables into 2D arrays (8x8)
 pst_2d = {
@@ -80,60 +92,484 @@ pst_2d = {
     ],
 }
 
-ZOBRIST_TABLE = {}
+# Endgame material values and piece-square tables (PeSTO), the ones above are for the middlegame
+MATERIAL_VALUES_EG = {
+    chess.PAWN: 94,
+    chess.KNIGHT: 281,
+    chess.BISHOP: 297,
+    chess.ROOK: 512,
+    chess.QUEEN: 936,
+    chess.KING: 60000
+}
+pst_2d_eg = {
+    chess.PAWN: [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [178, 173, 158, 134, 147, 132, 165, 187],
+        [94, 100, 85, 67, 56, 53, 82, 84],
+        [32, 24, 13, 5, -2, 4, 17, 17],
+        [13, 9, -3, -7, -7, -8, 3, -1],
+        [4, 7, -6, 1, 0, -5, -1, -8],
+        [13, 8, 8, 10, 13, 0, 2, -7],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+    ],
+    chess.KNIGHT: [
+        [-58, -38, -13, -28, -31, -27, -63, -99],
+        [-25, -8, -25, -2, -9, -25, -24, -52],
+        [-24, -20, 10, 9, -1, -9, -19, -41],
+        [-17, 3, 22, 22, 22, 11, 8, -18],
+        [-18, -6, 16, 25, 16, 17, 4, -18],
+        [-23, -3, -1, 15, 10, -3, -20, -22],
+        [-42, -20, -10, -5, -2, -20, -23, -44],
+        [-29, -51, -23, -15, -22, -18, -50, -64],
+    ],
+    chess.BISHOP: [
+        [-14, -21, -11, -8, -7, -9, -17, -24],
+        [-8, -4, 7, -12, -3, -13, -4, -14],
+        [2, -8, 0, -1, -2, 6, 0, 4],
+        [-3, 9, 12, 9, 14, 10, 3, 2],
+        [-6, 3, 13, 19, 7, 10, -3, -9],
+        [-12, -3, 8, 10, 13, 3, -7, -15],
+        [-14, -18, -7, -1, 4, -9, -15, -27],
+        [-23, -9, -23, -5, -9, -16, -5, -17],
+    ],
+    chess.ROOK: [
+        [13, 10, 18, 15, 12, 12, 8, 5],
+        [11, 13, 13, 11, -3, 3, 8, 3],
+        [7, 7, 7, 5, 4, -3, -5, -3],
+        [4, 3, 13, 1, 2, 1, -1, 2],
+        [3, 5, 8, 4, -5, -6, -8, -11],
+        [-4, 0, -5, -1, -7, -12, -8, -16],
+        [-6, -6, 0, 2, -9, -9, -11, -3],
+        [-9, 2, 3, -1, -5, -13, 4, -20],
+    ],
+    chess.QUEEN: [
+        [-9, 22, 22, 27, 27, 19, 10, 20],
+        [-17, 20, 32, 41, 58, 25, 30, 0],
+        [-20, 6, 9, 49, 47, 35, 19, 9],
+        [3, 22, 24, 45, 57, 40, 57, 36],
+        [-18, 28, 19, 47, 31, 34, 39, 23],
+        [-16, -27, 15, 6, 9, 17, 10, 5],
+        [-22, -23, -30, -16, -16, -23, -36, -32],
+        [-33, -28, -22, -43, -5, -32, -20, -41],
+    ],
+    chess.KING: [
+        [-74, -35, -18, -18, -11, 15, 4, -17],
+        [-12, 17, 14, 17, 17, 38, 23, 11],
+        [10, 17, 23, 15, 20, 45, 44, 13],
+        [-8, 22, 24, 27, 26, 33, 26, 3],
+        [-18, -4, 21, 24, 27, 23, 9, -11],
+        [-19, -3, 11, 21, 23, 16, 7, -9],
+        [-27, -11, 4, 13, 14, 4, -5, -17],
+        [-53, -34, -21, -11, -28, -14, -24, -43],
+    ],
+}
 
-# Material evaluation function
-def evaluate_board(board):
+# Score of each legal move of the side to move, and of each doubled, isolated or blocked pawn
+MOBILITY_WEIGHT = 10
+PAWN_STRUCTURE_WEIGHT = 50
+
+# The parameters written by texel_tuner.py, if any, replace the hand-written middlegame ones above
+try:
+    from tuned_parameters import MATERIAL_VALUES, pst_2d, MOBILITY_WEIGHT, PAWN_STRUCTURE_WEIGHT  # type: ignore[import-not-found, no-redef, unused-ignore]
+except ModuleNotFoundError as error:
+    if error.name != "tuned_parameters":
+        raise
+
+# The KPK bitbase written by kpk.py at build time, if any
+try:
+    from kpk_bitbase import KPK_BITBASE  # type: ignore[import-not-found, unused-ignore]
+except ModuleNotFoundError as error:
+    if error.name != "kpk_bitbase":
+        raise
+    KPK_BITBASE = None
+
+# Weight of the pieces in the game phase, which goes from MAX_PHASE with all of them on the board
+# (middlegame tables only) down to 0 (endgame tables only)
+PHASE_WEIGHTS = {chess.PAWN: 0, chess.KNIGHT: 1, chess.BISHOP: 1, chess.ROOK: 2, chess.QUEEN: 4, chess.KING: 0}
+MAX_PHASE = 24
+
+# Score of a checkmate at the root, mates further away score MATE_SCORE - ply
+MATE_SCORE = 100000
+MAX_PLY = 128
+# Values beyond this are mate scores, pruning on them would hide the distance to mate
+MATE_BOUND = MATE_SCORE - MAX_PLY
+# Score of a position the tablebases report won, above any evaluation and below the mate scores
+TB_WIN_SCORE = 20000
+# Score of a won ending the evaluation recognises, below the tablebase wins
+KNOWN_WIN_SCORE = 10000
+# Tablebase probe results kept by an Engine before the cache is cleared
+TB_CACHE_ENTRIES = 1 << 16
+
+# Frontier pruning margins by remaining depth (1 and 2), in centipawns
+FUTILITY_MARGINS = [0, 200, 500]
+REVERSE_FUTILITY_MARGINS = [0, 150, 300]
+RAZORING_MARGINS = [0, 300, 550]
+# Nodes this deep without a hash move first search IID_REDUCTION plies less to find one. Iterative deepening
+# leaves a hash move at every such node, so this only happens with a cold transposition table, and only in
+# searches deeper than the default Search Depth: its root moves are searched at depth 4. Lower thresholds do not
+# help there, 4 changes nothing and 3 searches 1.6% more nodes on the bench positions at depth 5
+IID_DEPTH = 5
+IID_REDUCTION = 2
+
+def build_piece_square_tables(material_values: dict[chess.PieceType, int] = MATERIAL_VALUES,
+                              piece_square_tables: dict[chess.PieceType, list[list[int]]] = pst_2d
+                              ) -> dict[chess.Color, dict[chess.PieceType, list[int]]]:
+    """Combine material values and 2D piece-square tables into tables indexed by [color][piece_type][square]."""
+    tables: dict[chess.Color, dict[chess.PieceType, list[int]]] = {chess.WHITE: {}, chess.BLACK: {}}
+    for piece_type, rows in piece_square_tables.items():
+        # The 2D tables are written from White's point of view with rank 8 first, Black reads them mirrored
+        tables[chess.WHITE][piece_type] = [material_values[piece_type]
+                                           + rows[7 - chess.square_rank(square)][chess.square_file(square)]
+                                           for square in chess.SQUARES]
+        tables[chess.BLACK][piece_type] = [material_values[piece_type]
+                                           + rows[chess.square_rank(square)][chess.square_file(square)]
+                                           for square in chess.SQUARES]
+    return tables
+
+PIECE_SQUARE_TABLES = build_piece_square_tables()
+PIECE_SQUARE_TABLES_EG = build_piece_square_tables(MATERIAL_VALUES_EG, pst_2d_eg)
+
+def game_phase(board: chess.Board) -> int:
+    """Game phase of a position, MAX_PHASE in the opening down to 0 with only kings and pawns."""
+    phase = 0
+    for piece_type, weight in PHASE_WEIGHTS.items():
+        if weight:
+            phase += weight * chess.popcount(board.pieces_mask(piece_type, chess.WHITE)
+                                             | board.pieces_mask(piece_type, chess.BLACK))
+    return phase
+
+# Whether a stored value is exact or only a lower/upper bound of the real value (fail high/low)
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+def value_to_tt(value: float, ply: int) -> float:
+    """Store mate values as a distance from the node instead of from the root."""
+    if value >= MATE_SCORE - MAX_PLY:
+        return value + ply
+    if value <= -(MATE_SCORE - MAX_PLY):
+        return value - ply
+    return value
+
+def value_from_tt(value: float, ply: int) -> float:
+    """Inverse of value_to_tt."""
+    if value >= MATE_SCORE - MAX_PLY:
+        return value - ply
+    if value <= -(MATE_SCORE - MAX_PLY):
+        return value + ply
+    return value
+
+# Approximate memory used by one transposition table entry (dict slot, key and tuple)
+TT_ENTRY_BYTES = 200
 
-    # if chess.polyglot.zobrist_hash(board) in ZOBRIST_TABLE:
-    #     return ZOBRIST_TABLE[chess.polyglot.zobrist_hash(board)]
+# A transposition table entry: depth, bound, white-relative value and best move
+TT_ENTRY_TYPE = tuple[int, int, float, Optional[chess.Move]]
 
+class TranspositionTable:
+    """Search results by zobrist hash: (depth, bound, white-relative value, best move)."""
+
+    def __init__(self, megabytes: int = 64) -> None:
+        """Create an empty table of about `megabytes` MB."""
+        self.entries: dict[int, TT_ENTRY_TYPE] = {}
+        self.resize(megabytes)
+
+    def resize(self, megabytes: int) -> None:
+        """Bound the table to about `megabytes` MB, it is cleared when it reaches that size."""
+        self.size = max(megabytes * 1024 * 1024 // TT_ENTRY_BYTES, 1)
+        if len(self.entries) > self.size:
+            self.entries.clear()
+
+    def clear(self) -> None:
+        """Forget every entry."""
+        self.entries.clear()
+
+    def probe(self, key: int) -> Optional[TT_ENTRY_TYPE]:
+        """Return the entry of a position, or None."""
+        return self.entries.get(key)
+
+    def store(self, key: int, depth: int, bound: int, value: float, move: Optional[chess.Move], ply: int) -> None:
+        """Remember the result of a search."""
+        if len(self.entries) >= self.size:
+            self.entries.clear()
+        self.entries[key] = (depth, bound, value_to_tt(value, ply), move)
+
+    def hashfull(self) -> int:
+        """Occupancy in permille, as reported by UCI `info hashfull`."""
+        return len(self.entries) * 1000 // self.size
+
+# Shared transposition table file: a header then ENTRY_BYTES slots of (key ^ data, data), little-endian
+SHARED_TT_MAGIC = b"LMXHASH\x01"
+SHARED_TT_HEADER_BYTES = 16
+SHARED_TT_ENTRY = struct.Struct("<QQ")
+
+class SharedTranspositionTable:
+    """
+    A fixed-size transposition table in a memory-mapped file, shared by the engine processes and kept between them.
+
+    The processes read and write it without locks. A slot stores the entry packed in 64 bits, the data, and the
+    key XOR the data: a slot torn by two writers, or by a crash, does not give back its key and reads as empty.
+    The data is the white-relative value (32 bits), the best move (16 bits), the depth and the bound.
+    """
+
+    def __init__(self, path: str, megabytes: int = 16) -> None:
+        """Map the table file `path`, created with about `megabytes` MB if it does not exist."""
+        import mmap  # noqa: PLC0415 Only needed with a shared table, keep it out of the engine startup
+
+        if not os.path.exists(path):
+            self.create(path, megabytes)
+        with open(path, "r+b") as file:
+            header = file.read(SHARED_TT_HEADER_BYTES)
+            slots = int.from_bytes(header[len(SHARED_TT_MAGIC):], "little")
+            if (header[:len(SHARED_TT_MAGIC)] != SHARED_TT_MAGIC or not slots or slots & (slots - 1)
+                    or os.path.getsize(path) != SHARED_TT_HEADER_BYTES + slots * SHARED_TT_ENTRY.size):
+                raise ValueError(f"{path} is not a shared transposition table")
+            # The size of an existing table wins, so that all the processes agree on the slots
+            self.size = slots
+            self.map = mmap.mmap(file.fileno(), 0)
+
+    @staticmethod
+    def create(path: str, megabytes: int) -> None:
+        """Write an empty table of about `megabytes` MB, unless another process has just done it."""
+        # Rounded down to a power of two slots, the slot is the low bits of the key
+        slots = 1 << max((megabytes * 1024 * 1024 // SHARED_TT_ENTRY.size).bit_length() - 1, 0)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(SHARED_TT_MAGIC + slots.to_bytes(8, "little"))
+            file.truncate(SHARED_TT_HEADER_BYTES + slots * SHARED_TT_ENTRY.size)
+        try:
+            # Linking does not replace an existing file, the table of the first process wins
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+
+    def close(self) -> None:
+        """Unmap the file, the entries stay in it."""
+        self.map.close()
+
+    def clear(self) -> None:
+        """Forget every entry, for all the processes."""
+        self.map[SHARED_TT_HEADER_BYTES:] = bytes(len(self.map) - SHARED_TT_HEADER_BYTES)
+
+    def probe(self, key: int) -> Optional[TT_ENTRY_TYPE]:
+        """Return the entry of a position, or None."""
+        check, data = SHARED_TT_ENTRY.unpack_from(self.map, SHARED_TT_HEADER_BYTES
+                                                  + (key & (self.size - 1)) * SHARED_TT_ENTRY.size)
+        if not data or check ^ data != key:
+            return None
+        value = data & 0xFFFFFFFF
+        move = (data >> 32) & 0xFFFF
+        return ((data >> 48) & 0xFF, data >> 56, value - (1 << 32) if value & 0x80000000 else value,
+                chess.Move(move & 63, (move >> 6) & 63, (move >> 12) or None) if move else None)
+
+    def store(self, key: int, depth: int, bound: int, value: float, move: Optional[chess.Move], ply: int) -> None:
+        """Remember the result of a search, replacing whatever shared its slot."""
+        stored_value = int(value_to_tt(value, ply))
+        packed_move = move.from_square | move.to_square << 6 | (move.promotion or 0) << 12 if move else 0
+        data = (stored_value & 0xFFFFFFFF) | packed_move << 32 | min(depth, 0xFF) << 48 | bound << 56
+        SHARED_TT_ENTRY.pack_into(self.map, SHARED_TT_HEADER_BYTES + (key & (self.size - 1)) * SHARED_TT_ENTRY.size,
+                                  key ^ data, data)
+
+    def hashfull(self) -> int:
+        """Occupancy in permille of the first 1000 slots, as reported by UCI `info hashfull`."""
+        sample = min(self.size, 1000)
+        used = sum(1 for index in range(sample)
+                   if SHARED_TT_ENTRY.unpack_from(self.map, SHARED_TT_HEADER_BYTES + index * SHARED_TT_ENTRY.size)[1])
+        return used * 1000 // sample
+
+# Bounds of the positional stage used by the lazy evaluation: the mobility bonus of the side to move
+# (positions with queens reach 60 moves) rarely exceeds the first, the pawn structure the second
+LAZY_MOBILITY_MARGIN = 80 * MOBILITY_WEIGHT
+LAZY_PAWN_MARGIN = 4 * PAWN_STRUCTURE_WEIGHT
+
+# Bytes of one eval cache slot, an unsigned 64-bit integer
+EVAL_CACHE_ENTRY_BYTES = 8
+
+class EvalCache:
+    """
+    Direct-mapped cache of full evaluations, apart from the transposition table.
+
+    A slot packs the upper half of the eval_key, which tells apart the positions sharing the slot,
+    and the score as a signed 32-bit integer in the lower half.
+    """
+
+    def __init__(self, megabytes: int = 4) -> None:
+        """Create an empty cache of about `megabytes` MB."""
+        self.resize(megabytes)
+
+    def resize(self, megabytes: int) -> None:
+        """Use about `megabytes` MB, rounded down to a power of two slots so the slot is the low bits of the key."""
+        self.size = 1 << max((megabytes * 1024 * 1024 // EVAL_CACHE_ENTRY_BYTES).bit_length() - 1, 0)
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget every score."""
+        self.slots = array.array("Q", bytes(EVAL_CACHE_ENTRY_BYTES * self.size))
+
+    def probe(self, key: int) -> Optional[int]:
+        """Return the score of a position, or None."""
+        slot = self.slots[key & (self.size - 1)]
+        if slot and slot >> 32 == key >> 32:
+            score = slot & 0xFFFFFFFF
+            return score - (1 << 32) if score & 0x80000000 else score
+        return None
+
+    def store(self, key: int, score: int) -> None:
+        """Remember the score of a position, replacing whatever shared its slot."""
+        self.slots[key & (self.size - 1)] = (key >> 32) << 32 | (score & 0xFFFFFFFF)
+
+def eval_key(board: chess.Board) -> int:
+    """
+    64-bit key of what the evaluation depends on.
+
+    That is the pieces, the side to move and, through the mobility, the castling rights and en passant square.
+    It is much cheaper than the zobrist hash.
+    """
+    return hash((board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+                 board.occupied_co[chess.WHITE], board.turn, board.castling_rights,
+                 board.ep_square or 0)) & 0xFFFFFFFFFFFFFFFF
+
+# Material evaluation function
+def evaluate_board(board: chess.Board) -> int:
     """Evaluate the board position."""
-    if board.is_checkmate():
-        score = -float('inf') if board.turn else float('inf')
-        ZOBRIST_TABLE[chess.polyglot.zobrist_hash(board)] = score
+    score = evaluate_terminal(board)
+    if score is None:
+        score = evaluate_endgame(board)
+    if score is not None:
         return score
+    return evaluate_material(board) + evaluate_positional(board)
+
+def evaluate_terminal(board: chess.Board, ply: int = 0) -> Optional[int]:
+    """Score of a finished game, or None if the game goes on. A mate `ply` plies from the root scores like in the search."""
+    if board.is_checkmate():
+        return -(MATE_SCORE - ply) if board.turn else MATE_SCORE - ply
 
     if board.is_stalemate() or board.is_insufficient_material():
-        score = 0
-        ZOBRIST_TABLE[chess.polyglot.zobrist_hash(board)] = score
-        return score
+        return 0
+    return None
+
+def material_key(board: chess.Board) -> str:
+    """Material signature of a position such as 'KRPvK', White's pieces first."""
+    return "v".join("".join(chess.piece_symbol(piece_type).upper() * chess.popcount(board.pieces_mask(piece_type, color))
+                            for piece_type in reversed(chess.PIECE_TYPES))
+                    for color in chess.COLORS)
+
+def push_to_edge(square: chess.Square) -> int:
+    """Bonus for a king driven away from the centre, from 0 to 120."""
+    file, rank = chess.square_file(square), chess.square_rank(square)
+    return 20 * (max(3 - file, file - 4) + max(3 - rank, rank - 4))
+
+def evaluate_kxk(board: chess.Board, strong: chess.Color) -> Optional[int]:
+    """
+    Score a queen or a rook against the lone king for the strong side.
+
+    The mate needs the weak king on the edge and the strong king next to it.
+    """
+    strong_king = chess.msb(board.kings & board.occupied_co[strong])
+    weak_king = chess.msb(board.kings & board.occupied_co[not strong])
+    material = sum(MATERIAL_VALUES_EG[piece_type] * chess.popcount(board.pieces_mask(piece_type, strong))
+                   for piece_type in (chess.QUEEN, chess.ROOK))
+    return (KNOWN_WIN_SCORE + material + push_to_edge(weak_king)
+            + 20 * (7 - chess.square_distance(strong_king, weak_king)))
 
+def evaluate_kpk(board: chess.Board, strong: chess.Color) -> Optional[int]:
+    """King and pawn against king from the bitbase, scored for the strong side, None without the bitbase."""
+    if KPK_BITBASE is None:
+        return None
+    # The bitbase has White's pawn on the files a-d
+    flip = 0 if strong == chess.WHITE else 56
+    pawn = board.pawns.bit_length() - 1
+    mirror = 7 if chess.square_file(pawn) > 3 else 0
+    pawn ^= flip ^ mirror
+    strong_king = chess.msb(board.kings & board.occupied_co[strong])
+    weak_king = chess.msb(board.kings & board.occupied_co[not strong])
+    index = ((0 if board.turn == strong else 1) | (weak_king ^ flip ^ mirror) << 1
+             | (strong_king ^ flip ^ mirror) << 7 | chess.square_file(pawn) << 13
+             | (6 - chess.square_rank(pawn)) << 15)
+    if not KPK_BITBASE[index >> 3] & (1 << (index & 7)):
+        return 0
+    # Pushing the pawn is progress
+    return KNOWN_WIN_SCORE + MATERIAL_VALUES_EG[chess.PAWN] + 20 * chess.square_rank(pawn)
+
+# Specialised evaluations by material signature, with White as the strong side
+ENDGAMES: dict[str, Callable[[chess.Board, chess.Color], Optional[int]]] = {
+    "KPvK": evaluate_kpk, "KRvK": evaluate_kxk, "KQvK": evaluate_kxk}
+# The same with the strong side: (color, function), for both colors
+ENDGAME_EVALUATORS = {
+    **{key: (chess.WHITE, function) for key, function in ENDGAMES.items()},
+    **{"v".join(key.split("v")[::-1]): (chess.BLACK, function) for key, function in ENDGAMES.items()},
+}
+ENDGAME_PIECES = max(len(key) - 1 for key in ENDGAMES)
+
+def evaluate_endgame(board: chess.Board) -> Optional[int]:
+    """White-relative score of a specialised endgame evaluation, or None if the material has none."""
+    if chess.popcount(board.occupied) > ENDGAME_PIECES:
+        return None
+    evaluator = ENDGAME_EVALUATORS.get(material_key(board))
+    if evaluator is None:
+        return None
+    strong, function = evaluator
+    score = function(board, strong)
+    if score is None:
+        return None
+    return score if strong == chess.WHITE else -score
+
+def evaluate_material(board: chess.Board, phase: Optional[int] = None) -> int:
+    """
+    Cheap stage of the evaluation: material and piece-square tables.
+
+    The middlegame and endgame scores are blended by the game phase, computed from the board if not given.
+    """
+    if phase is None:
+        phase = game_phase(board)
     # Calculate material score
     score = 0
+    endgame_score = 0
     # for piece_type in MATERIAL_VALUES:
     #     # logging.debug(f"There are {len(board.pieces(piece_type, chess.WHITE))} {chess.PIECE_NAMES[piece_type]} for White and {len(board.pieces(piece_type, chess.BLACK))} for Black")
     #     score += len(board.pieces(piece_type, chess.WHITE)) * MATERIAL_VALUES[piece_type]
     #     score -= len(board.pieces(piece_type, chess.BLACK)) * MATERIAL_VALUES[piece_type]
 
-        # Add material values and piece-square table values
+    # Add material values and piece-square table values
+    white_tables = PIECE_SQUARE_TABLES[chess.WHITE]
+    black_tables = PIECE_SQUARE_TABLES[chess.BLACK]
+    white_endgame_tables = PIECE_SQUARE_TABLES_EG[chess.WHITE]
+    black_endgame_tables = PIECE_SQUARE_TABLES_EG[chess.BLACK]
     for piece_type in MATERIAL_VALUES:
         # White pieces
+        table = white_tables[piece_type]
+        endgame_table = white_endgame_tables[piece_type]
         for square in board.pieces(piece_type, chess.WHITE):
-            rank = 7-chess.square_rank(square)
-            file = chess.square_file(square)
-            score += MATERIAL_VALUES[piece_type] + pst_2d[piece_type][rank][file]
+            score += table[square]
+            endgame_score += endgame_table[square]
 
-        # Black pieces (reverse the board for Black)
+        # Black pieces (the table is mirrored for Black)
+        table = black_tables[piece_type]
+        endgame_table = black_endgame_tables[piece_type]
         for square in board.pieces(piece_type, chess.BLACK):
-            rank = chess.square_rank(square)  # Reverse rank for Black
-            file = chess.square_file(square)  # File remains the same
-            score -= MATERIAL_VALUES[piece_type] + pst_2d[piece_type][rank][file]
+            score -= table[square]
+            endgame_score -= endgame_table[square]
 
+    # Promotions can push the phase past its opening value
+    phase = min(phase, MAX_PHASE)
+    return (score * phase + endgame_score * (MAX_PHASE - phase)) // MAX_PHASE
 
-    mobility_score = 10 * len(list(board.legal_moves))
-    score += mobility_score if board.turn else -mobility_score
+def evaluate_positional(board: chess.Board) -> int:
+    """Expensive stage of the evaluation: mobility, which generates the moves, and pawn structure."""
+    mobility_score = MOBILITY_WEIGHT * len(list(board.legal_moves))
+    score = mobility_score if board.turn else -mobility_score
+    return score + evaluate_pawn_structure(board)
 
+def evaluate_pawn_structure(board: chess.Board) -> int:
+    """Doubled, isolated and blocked pawns term of the evaluation."""
     nbr_doubled_pawns = count_doubled_pawns(board, chess.WHITE) - count_doubled_pawns(board, chess.BLACK)
     nbr_isolated_pawns = count_isolated_pawns(board, chess.WHITE) - count_isolated_pawns(board, chess.BLACK)
     nbr_blocked_pawns = count_blocked_pawns(board, chess.WHITE) - count_blocked_pawns(board, chess.BLACK)
-    DSI = 50 * (nbr_doubled_pawns + nbr_isolated_pawns + nbr_blocked_pawns)
-    score += DSI
-
-    ZOBRIST_TABLE[chess.polyglot.zobrist_hash(board)] = score
-    return score
+    DSI = PAWN_STRUCTURE_WEIGHT * (nbr_doubled_pawns + nbr_isolated_pawns + nbr_blocked_pawns)
+    return DSI
 
-def count_doubled_pawns(board, color):
+def count_doubled_pawns(board: chess.Board, color: chess.Color) -> int:
     """Count doubled pawns for a given color."""
     pawns = board.pieces(chess.PAWN, color)
     files = set()
@@ -146,7 +582,7 @@ def count_doubled_pawns(board, color):
             files.add(file_index)
     return doubled_count
 
-def count_isolated_pawns(board, color):
+def count_isolated_pawns(board: chess.Board, color: chess.Color) -> int:
     """Count isolated pawns for a given color."""
     pawns = board.pieces(chess.PAWN, color)
     isolated_count = 0
@@ -170,7 +606,7 @@ def count_isolated_pawns(board, color):
 
     return isolated_count
 
-def count_blocked_pawns(board, color):
+def count_blocked_pawns(board: chess.Board, color: chess.Color) -> int:
     """Count blocked pawns for a given color."""
     pawns = board.pieces(chess.PAWN, color)
     blocked_count = 0
@@ -182,55 +618,377 @@ def count_blocked_pawns(board, color):
             blocked_count += 1
     return blocked_count
 
+class AttackMap:
+    """
+    Attacked squares, pins and checkers of one position, each computed on first use.
+
+    One is made per search node and shared by the move ordering, the static exchange evaluation and the
+    pruning decisions of that node. It is only valid until the next move is played on the board.
+    """
+
+    def __init__(self, board: chess.Board) -> None:
+        """Start with nothing computed for `board`."""
+        self.board = board
+        self._attacks: dict[tuple[chess.Color, Optional[chess.PieceType]], chess.Bitboard] = {}
+        self._pinned: dict[chess.Color, chess.Bitboard] = {}
+        self._checkers: Optional[chess.Bitboard] = None
+
+    def attacks(self, color: chess.Color, piece_type: Optional[chess.PieceType] = None) -> chess.Bitboard:
+        """Squares attacked by the pieces of `color`, only by its pieces of `piece_type` if given."""
+        mask = self._attacks.get((color, piece_type))
+        if mask is None:
+            if piece_type is None:
+                mask = 0
+                for each_type in chess.PIECE_TYPES:
+                    mask |= self.attacks(color, each_type)
+            elif piece_type == chess.PAWN:
+                pawns = self.board.pieces_mask(chess.PAWN, color)
+                if color == chess.WHITE:
+                    mask = ((pawns << 9) & ~chess.BB_FILE_A | (pawns << 7) & ~chess.BB_FILE_H) & chess.BB_ALL
+                else:
+                    mask = (pawns >> 7) & ~chess.BB_FILE_A | (pawns >> 9) & ~chess.BB_FILE_H
+            else:
+                mask = 0
+                for square in chess.scan_reversed(self.board.pieces_mask(piece_type, color)):
+                    mask |= self.board.attacks_mask(square)
+            self._attacks[(color, piece_type)] = mask
+        return mask
+
+    def pinned(self, color: chess.Color) -> chess.Bitboard:
+        """Pieces of `color` pinned to their king."""
+        mask = self._pinned.get(color)
+        if mask is None:
+            mask = 0
+            for square in chess.scan_reversed(self.board.occupied_co[color]):
+                if self.board.is_pinned(color, square):
+                    mask |= chess.BB_SQUARES[square]
+            self._pinned[color] = mask
+        return mask
+
+    def checkers(self) -> chess.Bitboard:
+        """Pieces giving check to the side to move."""
+        if self._checkers is None:
+            self._checkers = self.board.checkers_mask()
+        return self._checkers
+
+    def in_check(self) -> bool:
+        """Whether the side to move is in check."""
+        return bool(self.checkers())
+
+def see(board: chess.Board, move: chess.Move, attacks: AttackMap) -> int:
+    """
+    Evaluate the static exchange of a capture or promotion, for the side to move.
+
+    Only the first exchange is counted: the captured piece, less the moving piece if a defender that is
+    not pinned can take it back.
+    """
+    captured = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+    gain = MATERIAL_VALUES[captured] if captured else 0
+    moving = cast(chess.PieceType, board.piece_type_at(move.from_square))
+    if move.promotion:
+        gain += MATERIAL_VALUES[move.promotion] - MATERIAL_VALUES[chess.PAWN]
+        moving = move.promotion
+    opponent = not board.turn
+    if attacks.attacks(opponent) & chess.BB_SQUARES[move.to_square] \
+            and board.attackers_mask(opponent, move.to_square) & ~attacks.pinned(opponent):
+        gain -= MATERIAL_VALUES[moving]
+    return gain
+
 # Order moves based on a heuristic
-def order_moves(board):
+def order_moves(board: chess.Board, search: Optional[SearchInfo] = None,
+                attacks: Optional[AttackMap] = None) -> list[chess.Move]:
     """Order moves to improve Alpha-Beta Pruning efficiency."""
-    def move_score(move):
-        # Prioritize captures of higher-value pieces
+    move_attacks = attacks if attacks is not None else AttackMap(board)
+
+    def move_score(move: chess.Move) -> float:  # noqa: PLR0911
+        # Prioritize the captures that win the most material
         if board.is_capture(move):
-            captured_piece = board.piece_at(move.to_square)
-            capturing_piece = board.piece_at(move.from_square)
-            if captured_piece is None:
-                captured_value = 0
-            else:
-                captured_value = MATERIAL_VALUES.get(captured_piece.piece_type, 0)
-            if capturing_piece is None:
-                capturing_value = 0
-            else:
-                capturing_value = MATERIAL_VALUES.get(capturing_piece.piece_type, 0)
-            return 100 + ((captured_value - capturing_value)/100)
+            return 100 + see(board, move, move_attacks) / 100
 
         # Prioritize castling
         if board.is_castling(move):
             return 90  # High score for castling moves
 
         # Prioritize checks
-        board.push(move)
-        is_check = board.is_check()
-        board.pop()
-        if is_check:
+        if board.gives_check(move):
             return 70  # High score for moves that give check
 
-        # Avoid threefold repetition
-        board.push(move)
-        is_repetition = board.is_repetition()
-        board.pop()
-        if is_repetition:
-            return -100  # Penalize moves that lead to threefold repetition
+        # Avoid threefold repetition, only a reversible move after at least three reversible ones can repeat
+        moved_piece = board.piece_type_at(move.from_square)
+        if board.halfmove_clock >= 3 and moved_piece != chess.PAWN:
+            board.push(move)
+            is_repetition = board.is_repetition()
+            board.pop()
+            if is_repetition:
+                return -100  # Penalize moves that lead to threefold repetition
 
         # Prioritize promotions
         if move.promotion:
             return 60  # High score for pawn promotions
 
+        # Avoid putting pieces where an enemy pawn takes them
+        if moved_piece != chess.PAWN \
+                and move_attacks.attacks(not board.turn, chess.PAWN) & chess.BB_SQUARES[move.to_square]:
+            return -50
+
         return 0  # Default score for other moves
 
+    start_time = time.perf_counter()
+    moves = list(board.legal_moves)
+    generated_time = time.perf_counter()
     # Sort moves by their heuristic score in descending order
-    return sorted(board.legal_moves, key=move_score, reverse=True)
+    moves.sort(key=move_score, reverse=True)
+    if search is not None:
+        search.movegen_time += generated_time - start_time
+        search.ordering_time += time.perf_counter() - generated_time
+    return moves
+
+def uci_output(line: str) -> None:
+    """Send a line to the GUI."""
+    print(line)  # noqa: T201
+    sys.stdout.flush()
+
+class SearchInfo:
+    """
+    Limits and counters shared by all the nodes of one search.
+
+    The transposition table and the eval cache are the only state kept between searches, the searches given
+    the same `tt` and `eval_cache` share them, there is no eval cache if it is None. `output` receives the UCI
+    info lines. The positions are scored by the nnue.Network `network` instead of the classical evaluation if
+    it is given. `tablebase` is a chess.syzygy.Tablebase probed in the search, its results are kept in the
+    `tablebase_cache` dict.
+    """
+
+    def __init__(self, time_limit: float = float("inf"), root_moves: Optional[list[chess.Move]] = None,
+                 node_limit: Optional[int] = None, multipv: int = 1,
+                 tt: Optional[Union[TranspositionTable, SharedTranspositionTable]] = None,
+                 output: Callable[[str], None] = uci_output, eval_cache: Optional[EvalCache] = None,
+                 network: Optional[nnue.Network] = None, tablebase: Optional[Tablebase] = None,
+                 tablebase_cache: Optional[dict[int, Optional[int]]] = None) -> None:
+        """Start the clock of a search with these limits and tables."""
+        self.start_time = time.time()
+        self.time_limit = time_limit
+        # The search stops before visiting more than node_limit nodes (UCI `go nodes`)
+        self.node_limit = node_limit
+        # Number of best root moves searched with an exact score (UCI MultiPV)
+        self.multipv = multipv
+        # Only these moves are searched at the root (UCI `go searchmoves`), all of them if None
+        self.root_moves = root_moves
+        # Frontier pruning at depth 1 and 2, each technique can be switched off with its UCI option
+        self.futility_pruning = True
+        self.reverse_futility_pruning = True
+        self.razoring = True
+        # Internal iterative deepening at nodes without a hash move, it has its UCI option too
+        self.internal_iterative_deepening = True
+        self.tt: Union[TranspositionTable, SharedTranspositionTable] = tt if tt is not None else TranspositionTable()
+        self.eval_cache = eval_cache
+        # Game phase of the searched position, kept by make_move and unmake_move once the root sets it
+        self.phase: Optional[int] = None
+        self.phase_stack: list[Optional[int]] = []
+        # NNUE accumulators of the searched line, kept by make_move and unmake_move once the root sets them
+        self.network = network
+        self.accumulator: Optional[nnue.Accumulator] = None
+        # Positions with at most tablebase_probe_limit pieces are probed after captures and pawn moves
+        self.tablebase = tablebase
+        self.tablebase_cache = tablebase_cache if tablebase_cache is not None else {}
+        self.tablebase_probe_limit = 7
+        self.output = output
+        self.nodes = 0
+        self.seldepth = 0
+        # Depth of the last completed iteration
+        self.depth = 0
+        self.stopped = False
+        # Result of the last root search: white-relative score and principal variation,
+        # and the (value, pv) of the MultiPV lines, best first
+        self.best_value = 0.0
+        self.pv: list[chess.Move] = []
+        self.lines: list[tuple[float, list[chess.Move]]] = []
+        # Always-on profiling counters, reported by print_search_stats
+        self.evals = 0
+        self.eval_time = 0.0
+        # Evaluations by stage, the positional stage is skipped by the lazy evaluations
+        self.material_eval_time = 0.0
+        self.positional_evals = 0
+        self.positional_eval_time = 0.0
+        self.lazy_evals = 0
+        self.eval_cache_hits = 0
+        self.ordering_time = 0.0
+        self.movegen_time = 0.0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tb_probes = 0
+        self.tb_hits = 0
+
+    def should_stop(self) -> bool:
+        """Whether the nodes or the time allocated to this search are used up."""
+        if (self.node_limit is not None and self.nodes >= self.node_limit
+                or time.time() - self.start_time > self.time_limit):
+            self.stopped = True
+        return self.stopped
+
+    def elapsed(self) -> float:
+        """Seconds since the search started."""
+        return time.time() - self.start_time
+
+def make_move(board: chess.Board, move: chess.Move, search: SearchInfo) -> None:
+    """Play a move in the search, updating the game phase and the NNUE accumulators from the moved pieces."""
+    if search.accumulator is not None:
+        search.accumulator.push(board, move)
+    search.phase_stack.append(search.phase)
+    if search.phase is not None:
+        if board.is_capture(move) and not board.is_en_passant(move):
+            search.phase -= PHASE_WEIGHTS[cast(chess.PieceType, board.piece_type_at(move.to_square))]
+        if move.promotion:
+            search.phase += PHASE_WEIGHTS[move.promotion]
+    board.push(move)
 
-def minimax(board, depth, alpha, beta, maximizing_player, start_time, time_limit):
-    """Minimax algorithm with Alpha-Beta Pruning."""
-    if time.time() - start_time > time_limit:
-        return evaluate_board(board)
+def unmake_move(board: chess.Board, search: SearchInfo) -> None:
+    """Take back the last move played with make_move."""
+    board.pop()
+    search.phase = search.phase_stack.pop()
+    if search.accumulator is not None:
+        search.accumulator.pop()
+
+def is_quiet(board: chess.Board, move: chess.Move) -> bool:
+    """Whether a move neither captures, promotes nor gives check."""
+    return not board.is_capture(move) and not move.promotion and not board.gives_check(move)
+
+def probe_tablebase(board: chess.Board, search: SearchInfo, ply: int) -> Optional[int]:
+    """
+    White-relative score of the position from the tablebases, or None if it is not probed or not found.
+
+    Only positions just reached by a capture or a pawn move are probed, the others were probed before
+    them or have too many pieces. Cursed wins and blessed losses are draws under the 50-move rule.
+    """
+    if (search.tablebase is None or board.halfmove_clock != 0 or board.castling_rights
+            or chess.popcount(board.occupied) > search.tablebase_probe_limit):
+        return None
+    search.tb_probes += 1
+    key = eval_key(board)
+    if key in search.tablebase_cache:
+        wdl = search.tablebase_cache[key]
+    else:
+        try:
+            wdl = search.tablebase.probe_wdl(board)
+        except KeyError:
+            # chess.syzygy.MissingTableError
+            wdl = None
+        if len(search.tablebase_cache) >= TB_CACHE_ENTRIES:
+            search.tablebase_cache.clear()
+        search.tablebase_cache[key] = wdl
+    if wdl is None:
+        return None
+    search.tb_hits += 1
+    # Closer wins score higher, like mates
+    value = TB_WIN_SCORE - ply if wdl == 2 else -(TB_WIN_SCORE - ply) if wdl == -2 else 0
+    return value if board.turn else -value
+
+def evaluate(board: chess.Board, search: SearchInfo, alpha: float = -float("inf"), beta: float = float("inf"),
+             ply: int = 0) -> int:
+    """
+    Evaluate a position reached by the search, keeping the evaluation counters.
+
+    The positional stage is skipped when it cannot bring the material stage inside the (alpha, beta) window,
+    the bound of the score on that side is returned instead, which is enough to fail low or high. Only full
+    evaluations go to the eval cache. The NNUE accumulators replace both stages when the search has them.
+    `ply` is the distance from the root, which scores the mates.
+    """
+    start_time = time.perf_counter()
+    search.evals += 1
+    score = evaluate_terminal(board, ply)
+    if score is None:
+        score = evaluate_endgame(board)
+    if score is None and search.accumulator is not None:
+        score = search.accumulator.evaluate(board)
+    key = None
+    if score is None and search.eval_cache is not None:
+        key = eval_key(board)
+        score = search.eval_cache.probe(key)
+        if score is not None:
+            search.eval_cache_hits += 1
+    if score is None:
+        score = evaluate_material(board, search.phase)
+        material_time = time.perf_counter()
+        search.material_eval_time += material_time - start_time
+        # The mobility bonus always goes to the side to move
+        lowest = score - LAZY_PAWN_MARGIN - (0 if board.turn else LAZY_MOBILITY_MARGIN)
+        highest = score + LAZY_PAWN_MARGIN + (LAZY_MOBILITY_MARGIN if board.turn else 0)
+        if highest <= alpha:
+            score = highest
+            search.lazy_evals += 1
+        elif lowest >= beta:
+            score = lowest
+            search.lazy_evals += 1
+        else:
+            score += evaluate_positional(board)
+            if key is not None and search.eval_cache is not None:
+                search.eval_cache.store(key, score)
+            search.positional_evals += 1
+            search.positional_eval_time += time.perf_counter() - material_time
+    search.eval_time += time.perf_counter() - start_time
+    return score
+
+def quiescence(board: chess.Board, alpha: float, beta: float, maximizing_player: bool, search: SearchInfo,
+               ply: int) -> float:
+    """Search the captures and promotions until the position is quiet, the side to move may stand pat."""
+    if search.should_stop():
+        return evaluate(board, search, ply=ply)
+    search.nodes += 1
+    search.seldepth = max(search.seldepth, ply)
+
+    stand_pat = evaluate(board, search, alpha, beta, ply)
+    best_value: float = stand_pat
+    if maximizing_player:
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+    else:
+        if stand_pat <= alpha:
+            return stand_pat
+        beta = min(beta, stand_pat)
+
+    attacks = AttackMap(board)
+    for move in order_moves(board, search, attacks):
+        if not board.is_capture(move) and not move.promotion:
+            continue
+        if see(board, move, attacks) < 0:
+            # Losing captures do not make the position quiet any sooner
+            continue
+        make_move(board, move, search)
+        value = quiescence(board, alpha, beta, not maximizing_player, search, ply + 1)
+        unmake_move(board, search)
+        if maximizing_player:
+            best_value = max(best_value, value)
+            alpha = max(alpha, value)
+        else:
+            best_value = min(best_value, value)
+            beta = min(beta, value)
+        if beta <= alpha or search.stopped:
+            break
+    return best_value
+
+def minimax(board: chess.Board, depth: int, alpha: float, beta: float,  # noqa: C901, PLR0911, PLR0912
+            maximizing_player: bool, search: SearchInfo, ply: int = 1, pv: Optional[list[chess.Move]] = None) -> float:
+    """
+    Minimax algorithm with Alpha-Beta Pruning.
+
+    `ply` is the distance from the root, used to score shorter mates higher. If `pv` is a list,
+    it is filled with the best line found from this node.
+    """
+    if pv is not None:
+        pv.clear()
+    if search.should_stop():
+        return evaluate(board, search, ply=ply)
+    search.nodes += 1
+    search.seldepth = max(search.seldepth, ply)
+
+    if board.is_checkmate():
+        return -(MATE_SCORE - ply) if board.turn else MATE_SCORE - ply
+
+    # A tablebase hit is the exact value of the node, whatever the depth and the window
+    tablebase_value = probe_tablebase(board, search, ply)
+    if tablebase_value is not None:
+        return tablebase_value
 
     if depth <= 0 or board.is_game_over():
         # if any(board.is_capture(move) for move in board.legal_moves):
@@ -240,7 +998,7 @@ def minimax(board, depth, alpha, beta, maximizing_player, start_time, time_limit
         #             if not board.is_capture(move):
         #                 continue
         #             board.push(move)
-        #             eval = minimax(board, depth - 1, alpha, beta, not maximizing_player, start_time, time_limit)
+        #             eval = minimax(board, depth - 1, alpha, beta, not maximizing_player, search)
         #             board.pop()
         #             if eval > max_eval:
         #                 max_eval = eval
@@ -255,7 +1013,7 @@ def minimax(board, depth, alpha, beta, maximizing_player, start_time, time_limit
         #             if not board.is_capture(move): 
         #                 continue
         #             board.push(move)
-        #             eval = minimax(board, depth - 1, alpha, beta, not maximizing_player, start_time, time_limit)
+        #             eval = minimax(board, depth - 1, alpha, beta, not maximizing_player, search)
         #             board.pop()
         #             if eval < min_eval:
         #                 min_eval = eval
@@ -264,105 +1022,895 @@ def minimax(board, depth, alpha, beta, maximizing_player, start_time, time_limit
         #             if beta <= alpha:
         #                 break
         #         return min_eval
-        return evaluate_board(board)
+        return evaluate(board, search, alpha, beta, ply)
+
+    key = chess.polyglot.zobrist_hash(board)
+    search.tt_probes += 1
+    entry = search.tt.probe(key)
+    tt_move = None
+    if entry is not None:
+        search.tt_hits += 1
+        entry_depth, bound, value, tt_move = entry
+        value = value_from_tt(value, ply)
+        if entry_depth >= depth and (bound == EXACT
+                                     or (bound == LOWER_BOUND and value >= beta)
+                                     or (bound == UPPER_BOUND and value <= alpha)):
+            if pv is not None and tt_move is not None:
+                pv.append(tt_move)
+            return value
+
+    # Frontier pruning, the bounds and the static evaluation are seen from the side to move
+    futile = False
+    attacks = AttackMap(board)
+    if depth <= 2 and not attacks.in_check() and (search.futility_pruning or search.reverse_futility_pruning
+                                                 or search.razoring):
+        sign = 1 if maximizing_player else -1
+        own_alpha, own_beta = (alpha, beta) if maximizing_player else (-beta, -alpha)
+        static_eval = evaluate(board, search, ply=ply)
+        own_eval = sign * static_eval
+        if search.reverse_futility_pruning and abs(own_beta) < MATE_BOUND \
+                and own_eval - REVERSE_FUTILITY_MARGINS[depth] >= own_beta:
+            # Static null move: even after giving up the margin the opponent cannot hold beta
+            return static_eval - sign * REVERSE_FUTILITY_MARGINS[depth]
+        if search.razoring and abs(own_alpha) < MATE_BOUND and own_eval + RAZORING_MARGINS[depth] <= own_alpha:
+            # Far below alpha, only captures can save this node
+            value = quiescence(board, alpha, beta, maximizing_player, search, ply)
+            if sign * value <= own_alpha:
+                return value
+        # Quiet moves cannot raise the evaluation by the margin, they are skipped
+        futile = search.futility_pruning and abs(own_alpha) < MATE_BOUND \
+            and own_eval + FUTILITY_MARGINS[depth] <= own_alpha
+
+    if tt_move is None and depth >= IID_DEPTH and search.internal_iterative_deepening:
+        # The reduced search leaves its best move in the TT, which orders the full one
+        minimax(board, depth - IID_REDUCTION, alpha, beta, maximizing_player, search, ply)
+        entry = search.tt.probe(key)
+        if entry is not None:
+            tt_move = entry[3]
 
+    original_alpha = alpha
+    original_beta = beta
     best_move = None
+    moves = order_moves(board, search, attacks)
+    if tt_move in moves:
+        # The best move of an earlier search of this position is searched first
+        moves.remove(tt_move)
+        moves.insert(0, tt_move)
+
+    child_pv: Optional[list[chess.Move]] = [] if pv is not None else None
 
     if maximizing_player:
         max_eval = -float('inf')
-        for move in order_moves(board):
-            board.push(move)
-            eval = minimax(board, depth - 1, alpha, beta, not maximizing_player, start_time, time_limit)
-            board.pop()
+        for move in moves:
+            if futile and best_move is not None and is_quiet(board, move):
+                continue
+            make_move(board, move, search)
+            eval = minimax(board, depth - 1, alpha, beta, not maximizing_player, search, ply + 1, child_pv)
+            unmake_move(board, search)
             if eval > max_eval:
                 max_eval = eval
                 best_move = move
+                if pv is not None and child_pv is not None:
+                    pv[:] = [move] + child_pv
             alpha = max(alpha, eval)
-            if beta <= alpha:
+            if beta <= alpha or search.stopped:
                 break
-        return max_eval
+        best_value = max_eval
     else:
         min_eval = float('inf')
-        for move in order_moves(board):
-            board.push(move)
-            eval = minimax(board, depth - 1, alpha, beta, not maximizing_player, start_time, time_limit)
-            board.pop()
+        for move in moves:
+            if futile and best_move is not None and is_quiet(board, move):
+                continue
+            make_move(board, move, search)
+            eval = minimax(board, depth - 1, alpha, beta, not maximizing_player, search, ply + 1, child_pv)
+            unmake_move(board, search)
             if eval < min_eval:
                 min_eval = eval
                 best_move = move
+                if pv is not None and child_pv is not None:
+                    pv[:] = [move] + child_pv
             beta = min(beta, eval)
-            if beta <= alpha:
+            if beta <= alpha or search.stopped:
                 break
-        return min_eval
+        best_value = min_eval
+
+    if not search.stopped:
+        if best_value <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_value >= original_beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        search.tt.store(key, depth, bound, best_value, best_move, ply)
+    return best_value
 
-def find_best_move(board, depth, total_time_remaining):
-    """Find the best move for the current player using Alpha-Beta Pruning with Time Management."""
+def find_best_move(board: chess.Board, depth: int, total_time_remaining: float,  # noqa: C901, PLR0912
+                   search: Optional[SearchInfo] = None) -> Optional[chess.Move]:
+    """
+    Find the best move for the current player using Alpha-Beta Pruning with Time Management.
+
+    The `search.multipv` best moves get an exact score, the other moves are searched with a null window
+    around the worst of these scores and only searched again if they beat it.
+    """
     PLAYING_WHITE = board.turn
-    print(f"info string Finding best move for {'White' if PLAYING_WHITE else 'Black'} at depth {depth} with total time remaining {total_time_remaining:.2f} seconds")
-    best_move = None
-    best_value = -float('inf') if PLAYING_WHITE else float('inf')
-    alpha = -float('inf')
-    beta = float('inf')
 
     # Calculate the time limit for this move
-    time_limit = total_time_remaining / 25
-    start_time = time.time()  # Record the start time
+    if search is None:
+        search = SearchInfo(move_time_limit(total_time_remaining))
+    search.output(f"info string Finding best move for {'White' if PLAYING_WHITE else 'Black'} at depth {depth} with total time remaining {total_time_remaining:.2f} seconds")
+    if not search.should_stop():
+        search.nodes += 1
+    search.phase = game_phase(board)
+    search.accumulator = search.network.accumulator(board) if search.network is not None else None
 
-    for move in order_moves(board):
-        if best_move is None:
-            best_move = move
-        board.push(move)
-        move_value = minimax(board, depth - 1, alpha, beta, not PLAYING_WHITE, start_time, time_limit)
-        if board.is_repetition():
-            print(f"info string Move {move.uci()} is a repetition, skipping")
-            move_value -= 100 if PLAYING_WHITE else 100
-        board.pop()
+    moves = order_moves(board, search)
+    if search.root_moves:
+        moves = [move for move in moves if move in search.root_moves]
+    # Search the best lines of the previous iteration first
+    previous_moves = [line_pv[0] for _, line_pv in search.lines if line_pv and line_pv[0] in moves]
+    moves = previous_moves + [move for move in moves if move not in previous_moves]
 
-        # Update the best move
-        if PLAYING_WHITE:
-            # if move.is_repetition():
-            #     move_value -= 100
-            if move_value > best_value:
-                best_value = move_value
-                best_move = move
-            alpha = max(alpha, move_value)
+    # (value, pv) of the best moves so far, best first
+    lines: list[tuple[float, list[chess.Move]]] = []
+    for move in moves:
+        child_pv: list[chess.Move] = []
+        make_move(board, move, search)
+        is_repetition = board.is_repetition()
+        if len(lines) < search.multipv or is_repetition:
+            move_value = minimax(board, depth - 1, -float('inf'), float('inf'), not PLAYING_WHITE, search, 1, child_pv)
+        elif PLAYING_WHITE:
+            worst_value = lines[-1][0]
+            move_value = minimax(board, depth - 1, worst_value, worst_value + 1, False, search, 1, child_pv)
+            if move_value > worst_value and not search.stopped:
+                move_value = minimax(board, depth - 1, worst_value, float('inf'), False, search, 1, child_pv)
         else:
-            # if move.is_repetition():
-            #     move_value += 100
-            if move_value < best_value:
-                best_value = move_value
-                best_move = move
-            beta = min(beta, move_value)
+            worst_value = lines[-1][0]
+            move_value = minimax(board, depth - 1, worst_value - 1, worst_value, True, search, 1, child_pv)
+            if move_value < worst_value and not search.stopped:
+                move_value = minimax(board, depth - 1, -float('inf'), worst_value, True, search, 1, child_pv)
+        if is_repetition:
+            search.output(f"info string Move {move.uci()} is a repetition, skipping")
+            move_value -= 100 if PLAYING_WHITE else 100
+        unmake_move(board, search)
+
+        # Update the best moves
+        if len(lines) < search.multipv or (move_value > lines[-1][0] if PLAYING_WHITE else move_value < lines[-1][0]):
+            lines.append((move_value, [move] + child_pv))
+            # The sort is stable, so the first move searched wins ties
+            lines.sort(key=lambda line: -line[0] if PLAYING_WHITE else line[0])
+            del lines[search.multipv:]
 
         # Stop searching if time is up
-        if time.time() - start_time > time_limit:
+        if search.should_stop():
             break
 
-    return best_move
+    if not lines:
+        return None
+    if not search.stopped or not search.lines:
+        search.lines = lines
+        search.best_value, search.pv = lines[0]
+    return lines[0][1][0]
+
+def relative_score(value: float, turn: chess.Color) -> tuple[str, int]:
+    """Convert a white-relative search value to ("cp", centipawns) or ("mate", moves) from the side to move."""
+    value = value if turn == chess.WHITE else -value
+    if abs(value) >= MATE_SCORE - MAX_PLY:
+        plies = int(MATE_SCORE - abs(value))
+        return "mate", (plies + 1) // 2 if value > 0 else -((plies + 1) // 2)
+    return "cp", int(value)
+
+def uci_score(value: float, turn: chess.Color) -> str:
+    """Convert a white-relative search value to a UCI `score cp|mate` string from the side to move."""
+    kind, amount = relative_score(value, turn)
+    return f"{kind} {amount}"
+
+def print_search_info(board: chess.Board, depth: int, search: SearchInfo) -> None:
+    """Print the UCI info lines of a completed iteration, one per MultiPV line."""
+    elapsed = search.elapsed()
+    for index, (value, pv) in enumerate(search.lines, start=1):
+        search.output(f"info depth {depth} seldepth {max(search.seldepth, depth)} multipv {index} "
+                      f"score {uci_score(value, board.turn)} nodes {search.nodes} "
+                      f"nps {int(search.nodes / max(elapsed, 1e-6))} "
+                      f"time {int(elapsed * 1000)} hashfull {search.tt.hashfull()} pv {' '.join(move.uci() for move in pv)}")
 
-def find_best_move_iterative(board, max_depth, total_time_remaining):
+def print_search_stats(search: SearchInfo) -> None:
+    """Print where the time of a search went, as an info string."""
+    elapsed = max(search.elapsed(), 1e-6)
+    tt_rate = f"{100 * search.tt_hits / search.tt_probes:.1f}%" if search.tt_probes else "n/a"
+    search.output(f"info string stats time {elapsed:.3f}s nodes {search.nodes} evals {search.evals} "
+                  f"eval {search.eval_time:.3f}s ({100 * search.eval_time / elapsed:.0f}%) "
+                  f"material {search.material_eval_time:.3f}s positional {search.positional_evals} "
+                  f"{search.positional_eval_time:.3f}s lazy {search.lazy_evals} eval cache hits {search.eval_cache_hits} "
+                  f"ordering {search.ordering_time:.3f}s ({100 * search.ordering_time / elapsed:.0f}%) "
+                  f"movegen {search.movegen_time:.3f}s ({100 * search.movegen_time / elapsed:.0f}%) "
+                  f"tt hits {search.tt_hits}/{search.tt_probes} ({tt_rate}) "
+                  f"tb hits {search.tb_hits}/{search.tb_probes}")
+
+# Numbers of the .pstats files written by this process
+PROFILE_NUMBERS = itertools.count(1)
+
+ProfiledResult = TypeVar("ProfiledResult")
+
+def profiled(function: Callable[..., ProfiledResult], *args: Any) -> tuple[ProfiledResult, str]:
+    """Run function(*args) under cProfile, dump the statistics to a new .pstats file and return (result, file)."""
+    import cProfile  # noqa: PLC0415 Only needed when profiling, keep it out of the engine startup
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args)
+    filename = f"uci_minimax-{os.getpid()}-{next(PROFILE_NUMBERS):04d}.pstats"
+    profiler.dump_stats(filename)
+    return result, filename
+
+def find_best_move_iterative(board: chess.Board, max_depth: int, total_time_remaining: float,
+                             search: Optional[SearchInfo] = None) -> Optional[chess.Move]:
     """Find the best move using iterative deepening."""
+    if search is None:
+        search = SearchInfo(move_time_limit(total_time_remaining))
     best_move = None
     for depth in range(1, max_depth + 1):
-        print(f"info string Searching at depth {depth}")
-        move = find_best_move(board, depth, total_time_remaining)
-        if move is not None:
-            best_move = move
-        else:
-            print("info string No legal moves found")
+        search.output(f"info string Searching at depth {depth}")
+        move = find_best_move(board, depth, total_time_remaining, search)
+        if move is None:
+            search.output("info string No legal moves found")
+            break
+        if search.stopped and best_move is not None:
+            # The iteration was cut short, keep the move of the last completed one
+            break
+        best_move = move
+        search.depth = depth
+        print_search_info(board, depth, search)
+        if search.stopped or count_root_moves(board, search) == 1:
+            break
+    return best_move
+
+# Mating lines found by mates_in, by (eval_key, moves)
+MATE_TABLE_TYPE = dict[tuple[int, int], Optional[list[chess.Move]]]
+
+def attacking_moves(board: chess.Board, checks_only: bool) -> list[chess.Move]:
+    """List the moves of the mating side, checks then captures then the rest, or only the checks."""
+    checks: list[chess.Move] = []
+    captures: list[chess.Move] = []
+    others: list[chess.Move] = []
+    for move in board.legal_moves:
+        if board.gives_check(move):
+            checks.append(move)
+        elif not checks_only:
+            (captures if board.is_capture(move) else others).append(move)
+    return checks + captures + others
+
+def mates_in(board: chess.Board, moves: int, search: SearchInfo, checks_only: int, table: MATE_TABLE_TYPE
+             ) -> Optional[list[chess.Move]]:
+    """
+    Find the line by which the side to move mates in at most `moves` moves, or None.
+
+    Only checks are tried once `moves` is at most `checks_only`, the last move of a mate is always one.
+    `table` keeps the results by (eval_key, moves) for the transpositions.
+    """
+    key = (eval_key(board), moves)
+    if key in table:
+        return table[key]
+    if search.should_stop():
+        return None
+    search.nodes += 1
+    result = None
+    for move in attacking_moves(board, moves <= checks_only):
+        board.push(move)
+        if board.is_checkmate():
+            result = [move]
+        elif moves > 1 and not board.is_game_over():
+            defence = longest_defence(board, moves - 1, search, checks_only, table)
+            if defence is not None:
+                result = [move] + defence
+        board.pop()
+        if result is not None:
+            break
+    if not search.stopped:
+        table[key] = result
+    return result
+
+def longest_defence(board: chess.Board, moves: int, search: SearchInfo, checks_only: int, table: MATE_TABLE_TYPE
+                    ) -> Optional[list[chess.Move]]:
+    """Find the reply that delays the mate the most and its line, or None if one reply escapes the mate in `moves`."""
+    search.nodes += 1
+    longest: Optional[list[chess.Move]] = None
+    for reply in order_moves(board):
+        board.push(reply)
+        line = None
+        for length in range(1, moves + 1):
+            line = mates_in(board, length, search, checks_only, table)
+            if line is not None:
+                break
+        board.pop()
+        if line is None:
+            return None
+        if longest is None or len(line) + 1 > len(longest):
+            longest = [reply] + line
+    return longest
+
+class ProofNode:
+    """A node of the proof-number search tree, the attacker is to move at even plies."""
+
+    __slots__ = ("children", "disproof", "move", "parent", "plies", "proof")
+
+    def __init__(self, move: Optional[chess.Move], parent: Optional[ProofNode], plies: int) -> None:
+        """Create an unexpanded node reached by `move`, it is neither proven nor disproven yet."""
+        self.move = move
+        self.parent = parent
+        self.children: Optional[list[ProofNode]] = None
+        self.proof = 1.0
+        self.disproof = 1.0
+        self.plies = plies
+
+    def attacker(self) -> bool:
+        """Whether the attacker is to move at this node."""
+        return self.plies % 2 == 0
+
+def expand_proof_node(board: chess.Board, node: ProofNode, max_plies: int, checks_only: int) -> list[ProofNode]:
+    """Create the children of a node and set their numbers, mates are proven and draws disproven."""
+    moves = attacking_moves(board, (max_plies - node.plies + 1) // 2 <= checks_only) if node.attacker() \
+        else list(board.legal_moves)
+    children = []
+    for move in moves:
+        child = ProofNode(move, node, node.plies + 1)
+        board.push(move)
+        if board.is_checkmate():
+            # Only the defender can be mated, the attacker only plays legal moves
+            child.proof, child.disproof = 0, float("inf")
+        elif board.is_game_over() or child.plies >= max_plies:
+            child.proof, child.disproof = float("inf"), 0
+        board.pop()
+        children.append(child)
+    node.children = children
+    return children
+
+def update_proof_numbers(node: ProofNode) -> None:
+    """Proof and disproof numbers of an expanded node from its children."""
+    if not node.children:
+        # The attacker has no moves left to try
+        node.proof, node.disproof = float("inf"), 0
+    elif node.attacker():
+        node.proof = min(child.proof for child in node.children)
+        node.disproof = sum(child.disproof for child in node.children)
+    else:
+        node.proof = sum(child.proof for child in node.children)
+        node.disproof = min(child.disproof for child in node.children)
+
+def proof_line(node: ProofNode) -> list[chess.Move]:
+    """Return the mating line of a proven node: the fastest mate, the longest defence."""
+    if not node.children:
+        return []
+    if node.attacker():
+        lines = [[cast(chess.Move, child.move)] + proof_line(child) for child in node.children if child.proof == 0]
+        return min(lines, key=len)
+    return max(([cast(chess.Move, child.move)] + proof_line(child) for child in node.children), key=len)
+
+def proof_number_search(board: chess.Board, moves: int, search: SearchInfo, checks_only: int
+                        ) -> Optional[list[chess.Move]]:
+    """Find the line by which the side to move mates in at most `moves` moves by proof-number search, or None."""
+    root = ProofNode(None, None, 0)
+    max_plies = 2 * moves - 1
+    board = board.copy()
+    while root.proof and root.disproof and not search.should_stop():
+        # Walk down to the most proving node
+        node = root
+        while node.children is not None:
+            node = min(node.children, key=lambda child: child.proof if node.attacker() else child.disproof)
+            board.push(cast(chess.Move, node.move))
+        children = expand_proof_node(board, node, max_plies, checks_only)
+        search.nodes += len(children) + 1
+        search.seldepth = max(search.seldepth, node.plies + 1)
+        parent: Optional[ProofNode] = node
+        while parent is not None:
+            update_proof_numbers(parent)
+            if parent.parent is not None:
+                board.pop()
+            parent = parent.parent
+    return proof_line(root) if root.proof == 0 else None
+
+def find_mate(board: chess.Board, moves: int, search: SearchInfo, checks_only: int = 1,
+              proof_number: bool = False) -> Optional[list[chess.Move]]:
+    """
+    Find the shortest mating line of the side to move in at most `moves` moves, or None if there is none.
+
+    The depth-first search proves mate in 1, 2... `moves` in turn, the proof-number search looks for any mate
+    within `moves` and keeps the fastest one of its proof tree. The line is reported as a UCI info line.
+    """
+    if proof_number:
+        line = proof_number_search(board, moves, search, checks_only)
+    else:
+        table: MATE_TABLE_TYPE = {}
+        line = None
+        for length in range(1, moves + 1):
+            line = mates_in(board, length, search, checks_only, table)
+            if line is not None or search.stopped:
+                break
+    if line is not None:
+        value = MATE_SCORE - len(line)
+        search.best_value = value if board.turn else -value
+        search.pv = line
+        search.lines = [(search.best_value, line)]
+        search.depth = len(line)
+        print_search_info(board, len(line), search)
+    else:
+        search.output(f"info string No mate in {moves} found" + (" (stopped)" if search.stopped else ""))
+    return line
+
+def count_root_moves(board: chess.Board, search: SearchInfo) -> int:
+    """Count the moves the search may play, there is nothing to think about when it is 1."""
+    if search.root_moves:
+        return sum(1 for move in search.root_moves if board.is_legal(move))
+    return board.legal_moves.count()
+
+# Standard perft positions with their known node counts for depth 1, 2, 3...
+PERFT_SUITE = [
+    ("startpos", chess.STARTING_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594]),
+]
+
+def perft(board: chess.Board, depth: int) -> int:
+    """Count the leaf nodes of the legal move tree (bulk counting at the last ply)."""
+    if depth <= 0:
+        return 1
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+def perft_divide(board: chess.Board, depth: int) -> list[tuple[chess.Move, int]]:
+    """Return the perft count below each root move, as a list of (move, nodes)."""
+    divide = []
+    for move in board.legal_moves:
+        board.push(move)
+        divide.append((move, perft(board, depth - 1)))
+        board.pop()
+    return divide
+
+def print_perft_divide(board: chess.Board, depth: int) -> int:
+    """Print the divide output of `go perft N` and return the total node count."""
+    start_time = time.time()
+    divide = perft_divide(board, depth) if depth > 0 else []
+    elapsed = time.time() - start_time
+    for move, nodes in divide:
+        uci_output(f"{move.uci()}: {nodes}")
+    total = sum(nodes for _, nodes in divide) if depth > 0 else 1
+    uci_output("")
+    uci_output(f"Nodes searched: {total}")
+    uci_output(f"info nodes {total} time {int(elapsed * 1000)} nps {int(total / max(elapsed, 1e-6))}")
+    return total
+
+def run_perft_suite(max_depth: int = 3) -> bool:
+    """Run perft on the standard positions, check the node counts and report the throughput."""
+    all_ok = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected_counts in PERFT_SUITE:
+        board = chess.Board(fen)
+        for depth, expected in enumerate(expected_counts[:max_depth], start=1):
+            start_time = time.time()
+            nodes = perft(board, depth)
+            elapsed = time.time() - start_time
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected else f"FAIL (expected {expected})"
+            all_ok = all_ok and nodes == expected
+            uci_output(f"{name:<10} depth {depth} nodes {nodes:>9} time {elapsed:7.3f}s "
+                       f"nps {int(nodes / max(elapsed, 1e-6)):>9} {status}")
+    uci_output(f"Total nodes {total_nodes} time {total_time:.3f}s nps {int(total_nodes / max(total_time, 1e-6))}")
+    uci_output("All perft counts match" if all_ok else "Perft MISMATCH")
+    return all_ok
+
+# Fixed positions searched by the bench command (from the Stockfish bench suite)
+BENCH_POSITIONS = [
+    chess.STARTING_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 11",
+    "4rrk1/pp1n3p/3q2pQ/2p1pb2/2PP4/2P3N1/P2B2PP/4RRK1 b - - 7 19",
+    "rq3rk1/ppp2ppp/1bnpb3/3N2B1/3NP3/7P/PPPQ1PP1/2KR3R w - - 7 14",
+    "r1bq1r1k/1pp1n1pp/1p1p4/4p2Q/4Pp2/1BNP4/PPP2PPP/3R1RK1 w - - 2 14",
+    "r3r1k1/2p2ppp/p1p1bn2/8/1q2P3/2NPQN2/PPP3PP/R4RK1 b - - 2 15",
+    "r1bbk1nr/pp3p1p/2n5/1N4p1/2Np1B2/8/PPP2PPP/2KR1B1R w kq - 0 13",
+    "r1bq1rk1/ppp1nppp/4n3/3p3Q/3P4/1BP1B3/PP1N2PP/R4RK1 w - - 1 16",
+    "4r1k1/r1q2ppp/ppp2n2/4P3/5Rb1/1N1BQ3/PPP3PP/R5K1 w - - 1 17",
+    "2rqkb1r/ppp2p2/2npb1p1/1N1Nn2p/2P1PP2/8/PP2B1PP/R1BQK2R b KQ - 0 11",
+    "r1bq1r1k/b1p1npp1/p2p3p/1p6/3PP3/1B2NN2/PP3PPP/R2Q1RK1 w - - 1 16",
+    "3r1rk1/p5pp/bpp1pp2/8/q1PP1P2/b3P3/P2NQRPP/1R2B1K1 b - - 6 22",
+    "r1q2rk1/2p1bppp/2Pp4/p6b/Q1PNp3/4B3/PP1R1PPP/2K4R w - - 2 18",
+    "4k2r/1pb2ppp/1p2p3/1R1p4/3P4/2r1PN2/P4PPP/1R4K1 b - - 3 22",
+    "3q2k1/pb3p1p/4pbp1/2r5/PpN2N2/1P2P2P/5PP1/Q2R2K1 b - - 4 26",
+    "6k1/6p1/6Pp/ppp5/3pn2P/1P3K2/1PP2P2/8 b - - 0 1",
+    "3b4/5kp1/1p1p1p1p/pP1PpP1P/P1P1P3/3KN3/8/8 w - - 0 1",
+    "2K5/p7/7P/5pR1/8/5k2/r7/8 w - - 0 1",
+    "8/6pk/1p6/8/PP3p1p/5P2/4KP1q/3Q4 w - - 0 1",
+    "7k/3p2pp/4q3/8/4Q3/5Kp1/P6b/8 w - - 0 1",
+    "8/2p5/8/2kPKp1p/2p4P/2P5/3P4/8 w - - 0 1",
+    "8/1p3pp1/7p/5P1P/2k3P1/8/2K2P2/8 w - - 0 1",
+    "8/pp2r1k1/2p1p3/3pP2p/1P1P1P1P/P5KR/8/8 w - - 0 1",
+    "8/3p4/p1bk3p/Pp6/1Kp1PpPp/2P2P1P/2P5/5B2 b - - 0 1",
+    "5k2/7R/4P2p/5K2/p1r2P1p/8/8/8 b - - 0 1",
+    "6k1/6p1/P6p/r1N5/5p2/7P/1b3PP1/4R1K1 w - - 0 1",
+    "1r3k2/4q3/2Pp3b/3Bp3/2Q2p2/1p1P2P1/1P2KP2/3N4 w - - 0 1",
+    "6k1/4pp1p/3p2p1/P1pPb3/R7/1r2P1PP/3B1P2/6K1 w - - 0 1",
+    "8/3p3B/5p2/5P2/p7/PP5b/k7/6K1 w - - 0 1",
+]
+
+BENCH_DEPTH = 3
+
+def run_bench(depth: int = BENCH_DEPTH, positions: list[str] = BENCH_POSITIONS,
+              tt: Optional[SharedTranspositionTable] = None) -> int:
+    """
+    Search the bench positions (FENs) to a fixed depth and report nodes, time, NPS and the node signature.
+
+    With a table `tt`, such as a SharedTranspositionTable, every position searches with it and its entries are kept:
+    the nodes then show what an earlier run over the same file saves, and are not the signature.
+    """
+    total_nodes = 0
+    start_time = time.time()
+    eval_cache = EvalCache()
+    for index, fen in enumerate(positions, start=1):
+        board = chess.Board(fen)
+        # Every position starts with empty caches so the signature does not depend on the order
+        eval_cache.clear()
+        search = SearchInfo(output=lambda _: None, tt=tt, eval_cache=eval_cache)
+        best_move = find_best_move_iterative(board, depth, float("inf"), search)
+        total_nodes += search.nodes
+        uci_output(f"Position {index:>2}/{len(positions)} nodes {search.nodes:>8} "
+                   f"bestmove {best_move.uci() if best_move else '0000'}")
+    elapsed = time.time() - start_time
+    uci_output("")
+    uci_output(f"Total time (ms) : {int(elapsed * 1000)}")
+    uci_output(f"Nodes searched  : {total_nodes}")
+    uci_output(f"Nodes/second    : {int(total_nodes / max(elapsed, 1e-6))}")
+    uci_output(f"Signature       : {total_nodes}")
+    return total_nodes
+
+# Keywords of the UCI go command, they end the move list of `searchmoves`
+GO_KEYWORDS = {"searchmoves", "ponder", "wtime", "btime", "winc", "binc", "movestogo", "depth", "nodes", "mate",
+               "movetime", "infinite", "perft"}
+
+def parse_searchmoves(board: chess.Board, tokens: list[str]) -> Optional[list[chess.Move]]:
+    """Return the legal moves listed after `searchmoves` in a go command, or None if there are none."""
+    if "searchmoves" not in tokens:
+        return None
+    root_moves = []
+    for token in tokens[tokens.index("searchmoves") + 1:]:
+        if token in GO_KEYWORDS:
             break
+        try:
+            move = chess.Move.from_uci(token)
+        except ValueError:
+            uci_output(f"info string Ignoring invalid searchmoves move {token}")
+            continue
+        if board.is_legal(move):
+            root_moves.append(move)
+    return root_moves or None
+
+# Value of a spin (int), check (bool) or string option, None for a button
+OPTION_VALUE_TYPE = Union[int, str, None]
+# Values of the UCI options by name, like the configuration dicts of lib.config
+OPTIONS_TYPE = dict[str, Any]
+
+class UciOption:
+    """An option advertised in the `uci` response and changed with `setoption`."""
+
+    def __init__(self, name: str, option_type: str, default: OPTION_VALUE_TYPE = None, minimum: int = 0,
+                 maximum: int = 0, on_change: Optional[Callable[..., None]] = None) -> None:
+        """Describe an option, `minimum` and `maximum` are the bounds of a spin."""
+        self.name = name
+        self.type = option_type  # "spin", "check", "string" or "button"
+        self.default = default
+        self.min = minimum
+        self.max = maximum
+        # Called with the Engine and the new value (only the Engine for a button) when the option is set
+        self.on_change = on_change
+
+    def uci(self) -> str:
+        """Return the `option` line of the `uci` response."""
+        if self.type == "button":
+            return f"option name {self.name} type button"
+        default: OPTION_VALUE_TYPE
+        if self.type == "check":
+            default = "true" if self.default else "false"
+        else:
+            default = self.default if self.default != "" else "<empty>"
+        bounds = f" min {self.min} max {self.max}" if self.type == "spin" else ""
+        return f"option name {self.name} type {self.type} default {default}{bounds}"
+
+    def parse(self, value: Optional[str]) -> OPTION_VALUE_TYPE:
+        """Convert the value of a setoption command, raising ValueError if it is invalid."""
+        if self.type == "spin":
+            return min(max(int(cast(str, value)), self.min), self.max)
+        if self.type == "check":
+            if value is None or value.lower() not in ("true", "false"):
+                raise ValueError(f"{value} is not true or false")
+            return value.lower() == "true"
+        if self.type == "string":
+            return "" if value in (None, "<empty>") else value
+        return None
+
+def set_debug_log_file(engine: Engine, path: str) -> None:  # noqa: ARG001
+    """Log the UCI traffic to `path`, or stop logging if it is empty."""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    if path:
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+
+def load_network(engine: Engine, value: OPTION_VALUE_TYPE = None) -> None:  # noqa: ARG001
+    """Load the EvalFile network if Use NNUE is on, the classical evaluation is used otherwise."""
+    engine.network = None
+    # The cached scores come from the previous evaluation
+    engine.eval_cache.clear()
+    path = engine.options["EvalFile"]
+    if engine.options["Use NNUE"] and path:
+        try:
+            # Only the NNUE needs NumPy, which the bot does not require
+            import nnue  # noqa: PLC0415
+
+            engine.network = nnue.Network.load(path)
+        except (ImportError, OSError, KeyError, ValueError) as error:
+            raise ValueError(f"Cannot load the network {path}: {error}") from None
+
+def open_tablebase(engine: Engine, path: str) -> None:
+    """Open the Syzygy tables of the directories of `path`, separated like PATH, or close them if it is empty."""
+    if engine.tablebase is not None:
+        engine.tablebase.close()
+    engine.tablebase = None
+    engine.tablebase_cache.clear()
+    if path:
+        import chess.syzygy  # noqa: PLC0415 Only needed with tablebases, keep it out of the engine startup
+
+        tablebase = chess.syzygy.Tablebase()
+        try:
+            count = sum(tablebase.add_directory(directory) for directory in path.split(os.pathsep) if directory)
+        except OSError as error:
+            tablebase.close()
+            raise ValueError(f"Cannot read the Syzygy tables in {path}: {error}") from None
+        if not count:
+            tablebase.close()
+            raise ValueError(f"No Syzygy tables in {path}")
+        engine.tablebase = tablebase
+
+def open_shared_hash(engine: Engine, value: OPTION_VALUE_TYPE = None) -> None:  # noqa: ARG001
+    """Search with the Shared Hash File table if set, the in-process one otherwise."""
+    if engine.shared_tt is not None:
+        engine.shared_tt.close()
+    engine.shared_tt = None
+    path = engine.options["Shared Hash File"]
+    if path:
+        try:
+            engine.shared_tt = SharedTranspositionTable(path, engine.options["Shared Hash Size"])
+        except OSError as error:
+            raise ValueError(f"Cannot open {path}: {error}") from None
+
+UCI_OPTIONS = [
+    # Memory
+    UciOption("Hash", "spin", 64, 1, 4096, lambda engine, megabytes: engine.tt.resize(megabytes)),
+    UciOption("Clear Hash", "button", on_change=lambda engine: engine.tt.clear()),
+    UciOption("Eval Cache", "spin", 4, 1, 1024, lambda engine, megabytes: engine.eval_cache.resize(megabytes)),
+    # A table file shared by the engine processes and kept between them, its size is set by the process creating it
+    UciOption("Shared Hash File", "string", "", on_change=open_shared_hash),
+    UciOption("Shared Hash Size", "spin", 16, 1, 4096, open_shared_hash),
+    # Search
+    UciOption("MultiPV", "spin", 1, 1, 256),
+    UciOption("Search Depth", "spin", 5, 1, MAX_PLY),
+    UciOption("Futility Pruning", "check", True),
+    UciOption("Reverse Futility Pruning", "check", True),
+    UciOption("Razoring", "check", True),
+    # Only at nodes IID_DEPTH plies from the horizon, so not with the default Search Depth
+    UciOption("Internal Iterative Deepening", "check", True),
+    # Mate search (go mate)
+    UciOption("Mate Checks Only", "spin", 1, 1, 50),
+    UciOption("Proof Number Search", "check", False),
+    # Evaluation
+    UciOption("Use NNUE", "check", False, on_change=load_network),
+    UciOption("EvalFile", "string", "", on_change=load_network),
+    # Endgame tablebases
+    UciOption("SyzygyPath", "string", "", on_change=open_tablebase),
+    UciOption("SyzygyProbeLimit", "spin", 7, 0, 7),
+    # Time management
+    UciOption("Move Overhead", "spin", 10, 0, 5000),
+    UciOption("Moves To Go", "spin", 25, 1, 200),
+    # Debugging
+    UciOption("Debug Log File", "string", "", on_change=set_debug_log_file),
+    UciOption("Profile", "check", False),
+]
+
+# Values of the UCI options of a new Engine, by name
+DEFAULT_OPTIONS: OPTIONS_TYPE = {option.name: option.default for option in UCI_OPTIONS if option.type != "button"}
+
+def move_time_limit(total_time_remaining: float, options: OPTIONS_TYPE = DEFAULT_OPTIONS) -> float:
+    """Seconds to spend on this move given the time left on our clock."""
+    overhead: int = options["Move Overhead"]
+    moves_to_go: int = options["Moves To Go"]
+    return max(total_time_remaining - overhead / 1000, 0.01) / moves_to_go
+
+class Engine:
+    """
+    The state kept between the searches of a game.
+
+    That is the option values, the transposition table (or the shared one), the eval cache, the NNUE network and
+    the Syzygy tablebases with their probe cache.
+
+    Engines share nothing, so several games can be played in the same process.
+    """
+
+    def __init__(self) -> None:
+        """Start with the default options and empty tables."""
+        self.options = dict(DEFAULT_OPTIONS)
+        self.tt = TranspositionTable(self.options["Hash"])
+        self.shared_tt: Optional[SharedTranspositionTable] = None
+        self.eval_cache = EvalCache(self.options["Eval Cache"])
+        self.network: Optional[nnue.Network] = None
+        self.tablebase: Optional[Tablebase] = None
+        self.tablebase_cache: dict[int, Optional[int]] = {}
+
+    def set_option(self, name: Optional[str], value: Optional[str]) -> None:
+        """Apply a setoption command, raising ValueError for unknown options and invalid values."""
+        # UCI option names are case insensitive
+        option = next((option for option in UCI_OPTIONS if option.name.lower() == (name or "").lower()), None)
+        if option is None:
+            raise ValueError(f"Unknown option: {name}")
+        try:
+            parsed_value = option.parse(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {option.name}: {value}") from None
+        if option.type == "button":
+            if option.on_change is not None:
+                option.on_change(self)
+            return
+        previous_value = self.options[option.name]
+        self.options[option.name] = parsed_value
+        if option.on_change is not None:
+            try:
+                option.on_change(self, parsed_value)
+            except ValueError:
+                # A rejected value leaves the option, and the engine state it gave, as they were
+                self.options[option.name] = previous_value
+                option.on_change(self, previous_value)
+                raise
+
+    def new_game(self) -> None:
+        """Forget what was learned in the previous game, except in the shared table which is there to keep it."""
+        self.tt.clear()
+        self.eval_cache.clear()
+
+    def search(self, board: chess.Board, depth: int, total_time_remaining: float = float("inf"),
+               root_moves: Optional[list[chess.Move]] = None, node_limit: Optional[int] = None,
+               move_time: Optional[float] = None,
+               output: Callable[[str], None] = uci_output) -> tuple[Optional[chess.Move], SearchInfo]:
+        """
+        Search with iterative deepening, return the best move and the SearchInfo of the search.
+
+        The search takes `move_time` seconds if given, otherwise a share of `total_time_remaining`.
+        """
+        time_limit = move_time if move_time is not None else move_time_limit(total_time_remaining, self.options)
+        tt = self.shared_tt if self.shared_tt is not None else self.tt
+        eval_cache = self.eval_cache
+        if node_limit is not None:
+            # Entries left by earlier searches change the tree, a node-limited search starts from empty tables
+            # so that the same `go nodes` always gives the same move
+            tt = TranspositionTable(self.options["Hash"])
+            eval_cache = EvalCache(self.options["Eval Cache"])
+        search = SearchInfo(time_limit, root_moves, node_limit, self.options["MultiPV"], tt, output,
+                            eval_cache, self.network, self.tablebase, self.tablebase_cache)
+        search.tablebase_probe_limit = self.options["SyzygyProbeLimit"]
+        search.futility_pruning = self.options["Futility Pruning"]
+        search.reverse_futility_pruning = self.options["Reverse Futility Pruning"]
+        search.razoring = self.options["Razoring"]
+        search.internal_iterative_deepening = self.options["Internal Iterative Deepening"]
+        if self.options["Profile"]:
+            best_move, filename = profiled(find_best_move_iterative, board, depth, total_time_remaining, search)
+            output(f"info string Profile written to {filename}")
+        else:
+            best_move = find_best_move_iterative(board, depth, total_time_remaining, search)
+        print_search_stats(search)
+        return best_move, search
+
+    def mate(self, board: chess.Board, moves: int, node_limit: Optional[int] = None, move_time: Optional[float] = None,
+             output: Callable[[str], None] = uci_output) -> tuple[Optional[list[chess.Move]], SearchInfo]:
+        """Look for a mate in `moves` moves, return the mating line (None if none) and the SearchInfo."""
+        tt = TranspositionTable(self.options["Hash"]) if node_limit is not None else self.tt
+        search = SearchInfo(move_time if move_time is not None else float("inf"), node_limit=node_limit,
+                            tt=tt, output=output)
+        line = find_mate(board, moves, search, self.options["Mate Checks Only"], self.options["Proof Number Search"])
+        return line, search
+
+def parse_setoption(line: str) -> tuple[Optional[str], Optional[str]]:
+    """Return the (name, value) of a `setoption name <name> [value <value>]` command."""
+    tokens = line.split()
+    if "name" not in tokens:
+        return None, None
+    name_index = tokens.index("name") + 1
+    value_index = tokens.index("value") if "value" in tokens else len(tokens)
+    value = " ".join(tokens[value_index + 1:]) if value_index < len(tokens) else None
+    return " ".join(tokens[name_index:value_index]), value
+
+def parse_go_limits(board: chess.Board, tokens: list[str], options: OPTIONS_TYPE
+                    ) -> tuple[int, float, Optional[int], Optional[float]]:
+    """Return the depth, the time left on our clock, the node limit and the move time of a go command."""
+    total_time_remaining = 50.0  # Default total time in seconds
+    search_depth: int = options["Search Depth"]
+    node_limit = None
+    move_time = None
+
+    if "movetime" in tokens:
+        move_time = int(tokens[tokens.index("movetime") + 1]) / 1000
+        if "depth" not in tokens:
+            # The time decides when to stop, like the nodes below
+            search_depth = MAX_PLY
+    if "depth" in tokens:
+        depth_index = tokens.index("depth") + 1
+        search_depth = int(tokens[depth_index])
+    if "nodes" in tokens:
+        node_limit = int(tokens[tokens.index("nodes") + 1])
+        if "depth" not in tokens:
+            search_depth = MAX_PLY
+        if "wtime" not in tokens and "btime" not in tokens:
+            # A node-limited search must not depend on the speed of the machine
+            total_time_remaining = float("inf")
+    if "wtime" in tokens and board.turn:  # White's time remaining
+        time_index = tokens.index("wtime") + 1
+        total_time_remaining = int(tokens[time_index]) / 1000  # Convert milliseconds to seconds
+    if "btime" in tokens and not board.turn:  # Black's time remaining
+        time_index = tokens.index("btime") + 1
+        total_time_remaining = int(tokens[time_index]) / 1000  # Convert milliseconds to seconds
+    return search_depth, total_time_remaining, node_limit, move_time
+
+def go(engine: Engine, board: chess.Board, tokens: list[str]) -> Optional[chess.Move]:
+    """Search the position as the go command `tokens` asks, return the move to play or None if there is none."""
+    search_depth, total_time_remaining, node_limit, move_time = parse_go_limits(board, tokens, engine.options)
+
+    mate_moves = None
+    if "mate" in tokens:
+        mate_index = tokens.index("mate") + 1
+        if mate_index < len(tokens) and tokens[mate_index].isdigit() and int(tokens[mate_index]) > 0:
+            mate_moves = int(tokens[mate_index])
+        else:
+            uci_output("info string go mate needs a number of moves, searching normally")
+
+    if mate_moves is not None:
+        # The mate search gets the time of a normal search, there is no stop command to end it
+        mate_time = move_time if move_time is not None else move_time_limit(total_time_remaining, engine.options)
+        mate_line, mate_search = engine.mate(board, mate_moves, node_limit, mate_time)
+        if mate_line:
+            return mate_line[0]
+        # Without a mate, play the move of a normal search in what is left, its first iteration always gives one
+        move_time = max(mate_time - mate_search.elapsed(), 0)
+        if node_limit is not None:
+            node_limit = max(node_limit - mate_search.nodes, 1)
+    best_move, _ = engine.search(board, search_depth, total_time_remaining, parse_searchmoves(board, tokens),
+                                 node_limit, move_time)
     return best_move
 
 # UCI-compatible engine
-def main():
+def main(engine: Optional[Engine] = None) -> None:
+    """Speak UCI on stdin and stdout until `quit` or the end of the input."""
     board = chess.Board()
-    depth = 5
+    engine = engine if engine is not None else Engine()
 
     while True:
-        line = sys.stdin.readline().strip()
+        line = sys.stdin.readline()
+        if not line:
+            break
+        line = line.strip()
+        logger.debug(f"<< {line}")
         if line == "uci":
             print("id name Le Minimaxeur")
             print("id author Hughes Perreault")
+            for option in UCI_OPTIONS:
+                print(option.uci())  # noqa: T201
             print("uciok")
             sys.stdout.flush()
         elif line == "isready":
@@ -370,34 +1918,39 @@ def main():
             sys.stdout.flush()
         elif line == "ucinewgame":
             board.reset()
+            engine.new_game()
         elif line.startswith("position"):
             tokens = line.split()
             if "startpos" in tokens:
                 board.reset()
-                if "moves" in tokens:
-                    moves_index = tokens.index("moves") + 1
-                    for move_str in tokens[moves_index:]:
-                        board.push_uci(move_str)
+            elif "fen" in tokens:
+                fen_index = tokens.index("fen") + 1
+                moves_index = tokens.index("moves") if "moves" in tokens else len(tokens)
+                board.set_fen(" ".join(tokens[fen_index:moves_index]))
+            if "moves" in tokens:
+                moves_index = tokens.index("moves") + 1
+                for move_str in tokens[moves_index:]:
+                    board.push_uci(move_str)
         elif line.startswith("go"):
             tokens = line.split()
-            total_time_remaining = 50  # Default total time in seconds
-
-            if "depth" in tokens:
-                depth_index = tokens.index("depth") + 1
-                depth = int(tokens[depth_index])
-            if "wtime" in tokens and board.turn:  # White's time remaining
-                time_index = tokens.index("wtime") + 1
-                total_time_remaining = int(tokens[time_index]) / 1000  # Convert milliseconds to seconds
-            if "btime" in tokens and not board.turn:  # Black's time remaining
-                time_index = tokens.index("btime") + 1
-                total_time_remaining = int(tokens[time_index]) / 1000  # Convert milliseconds to seconds
-
-            best_move = find_best_move_iterative(board, depth, total_time_remaining)
+            if "perft" in tokens:
+                print_perft_divide(board, int(tokens[tokens.index("perft") + 1]))
+                continue
+            best_move = go(engine, board, tokens)
             if best_move is not None:
                 print(f"bestmove {best_move.uci()}")
             else:
                 print("bestmove 0000")  # Indicate no legal moves
             sys.stdout.flush()
+            logger.debug(f">> bestmove {best_move.uci() if best_move else '0000'}")
+        elif line.startswith("setoption"):
+            try:
+                engine.set_option(*parse_setoption(line))
+            except ValueError as error:
+                uci_output(f"info string {error}")
+        elif line.startswith("bench"):
+            tokens = line.split()
+            run_bench(int(tokens[1]) if len(tokens) > 1 else BENCH_DEPTH)
         elif line == "quit":
             break
 
@@ -406,4 +1959,37 @@ def main():
             sys.stdout.flush()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Le Minimaxeur UCI engine.")
+    parser.add_argument("command", nargs="?", default="uci", choices=["uci", "perft", "bench"],
+                        help="'uci' (default) speaks UCI on stdin/stdout, 'perft' runs the perft suite, "
+                             "'bench' searches the bench positions.")
+    parser.add_argument("--depth", type=int, help="Maximum perft depth of the suite (default 3), "
+                                                   f"or the bench search depth (default {BENCH_DEPTH}).")
+    parser.add_argument("--fen", help="Run perft with divide output on this position instead of the suite.")
+    parser.add_argument("--profile", action="store_true", help="Profile every search and dump the .pstats files.")
+    parser.add_argument("--dataset", help="Bench the first positions of a position_dataset.py file instead.")
+    parser.add_argument("--count", type=int, default=len(BENCH_POSITIONS),
+                        help=f"Number of dataset positions to bench (default {len(BENCH_POSITIONS)}).")
+    parser.add_argument("--shared-hash", help="Bench with this shared hash file, created if missing and kept, "
+                                              "so that a second run shows the entries it reuses.")
+    args = parser.parse_args()
+    engine = Engine()
+    engine.options["Profile"] = args.profile
+    if args.command == "perft":
+        args.depth = args.depth or 3
+        if args.fen:
+            print_perft_divide(chess.Board(args.fen), args.depth)
+        else:
+            sys.exit(0 if run_perft_suite(args.depth) else 1)
+    elif args.command == "bench":
+        positions = BENCH_POSITIONS
+        if args.dataset:
+            from position_dataset import PositionDataset  # Needs NumPy, which the engine does not
+
+            positions = [board.fen() for board in PositionDataset(args.dataset).boards(0, args.count)]
+        shared_tt = SharedTranspositionTable(args.shared_hash) if args.shared_hash else None
+        run_bench(args.depth or BENCH_DEPTH, positions, shared_tt)
+    else:
+        main(engine)
\ No newline at end of file